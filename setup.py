@@ -14,5 +14,6 @@ setup(name="w2kplot",
       package_data={'w2kplot': ['w2kplot_base.mplstyle',
                                 'w2kplot_bands.mplstyle']
                     },
-      scripts=["w2kplot/cli/w2kplot-bands", "w2kplot/cli/w2kplot-fatbands"]
+      scripts=["w2kplot/cli/w2kplot-bands", "w2kplot/cli/w2kplot-fatbands", "w2kplot/cli/w2kplot-batch",
+               "w2kplot/cli/w2kplot-serve"]
       )
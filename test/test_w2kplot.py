@@ -1,12 +1,31 @@
 import glob
+import gzip
+import io
+import json
+import lzma
 import os
+import pickle
+import shutil
+import tempfile
+import threading
 import time
+import urllib.request
+import urllib.error
 import numpy as np
 import matplotlib.pyplot as plt
 
 from w2kplot.bands import Bands, FatBands, band_plot, fatband_plot
-from w2kplot.utils import make_label
+from w2kplot.utils import make_label, open_file
 from w2kplot.structure import Structure
+from w2kplot.qtl import Qtl
+from w2kplot.case import Case
+from w2kplot.batch import batch_render
+from w2kplot.animate import SeriesAnimation
+from w2kplot.export import heavy_artists, export_policy, savefig
+from w2kplot.grid import fatband_grid, render_fatband_grid
+from w2kplot.watch import FatBandsWatcher
+from w2kplot.server import make_server, CaseCache
+from w2kplot import profile
 
 import unittest
 
@@ -16,8 +35,54 @@ target_Ek = np.loadtxt(glob.glob(os.getcwd() + "/test/*dat")[0])
 struct_file = glob.glob(os.getcwd() + "/test/*struct")[0]
 
 
+def make_case(directory, nbands=4):
+    """
+    copy the test case into directory and add a synthetic case.qtl and case.scf.
+    """
+    for fname in [spaghetti, klist_band, struct_file]:
+        shutil.copy(fname, directory)
+    nk = target_Ek.shape[1]
+    rng = np.random.default_rng(0)
+    weights = rng.random((nbands, nk, 5, 4))
+    with open(os.path.join(directory, "case.qtl"), "w") as f:
+        f.write("CsV3Sb5\n LATTICE CONST.=  10.3839  10.3839  17.5905   FERMI ENERGY=  0.5\n")
+        for atom in range(1, 5):
+            f.write(f" JATOM  {atom} MULT= 1 ISPLIT= 8 tot,0,1,2\n")
+        for b in range(nbands):
+            f.write(f" BAND:{b + 1:4d}\n")
+            for k in range(nk):
+                for atom in range(1, 6):
+                    w = weights[b, k, atom - 1] if atom < 5 else weights[b, k, atom - 1, :1]
+                    f.write(f"{target_Ek[b, k] / 13.6 + 0.5:10.5f}{atom:3d}" + "".join(f"{x:8.5f}" for x in w) + "\n")
+    with open(os.path.join(directory, "case.scf"), "w") as f:
+        f.write(":FER  : F E R M I - ENERGY(TETRAH.M.)=   0.5000000000\n")
+    return weights
+
+
 class Testw2kplot(unittest.TestCase):
 
+    @classmethod
+    def setUpClass(cls):
+        # a synthetic case shared by all tests, and a directory for their outputs
+        cls._tmp = tempfile.TemporaryDirectory()
+        cls.directory = os.path.join(cls._tmp.name, "case")
+        cls.output = os.path.join(cls._tmp.name, "output")
+        os.mkdir(cls.directory)
+        os.mkdir(cls.output)
+        cls.weights = make_case(cls.directory)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._tmp.cleanup()
+
+    def copy_case(self, name):
+        """
+        copy the shared case, for tests which modify its files.
+        """
+        directory = os.path.join(self.output, name)
+        shutil.copytree(self.directory, directory)
+        return directory
+
     def test_structure(self):
         struct = Structure(struct_file)
         self.assertEqual(len(struct), 4)
@@ -46,6 +111,375 @@ class Testw2kplot(unittest.TestCase):
         dft = Bands(spaghetti=spaghetti, klist_band=klist_band)
         np.testing.assert_allclose(dft.Ek, target_Ek)
 
+    def test_qtl_parser(self):
+        qtl = Qtl(os.path.join(self.directory, "case.qtl"))
+        self.assertEqual(len(qtl), 4)
+        self.assertEqual(qtl.nkpoints, target_Ek.shape[1])
+        self.assertEqual(qtl.orbitals[1], ["tot", "0", "1", "2"])
+        np.testing.assert_allclose(qtl.character(2, 3), self.weights[:, :, 1, 2], atol=1e-5)
+        np.testing.assert_allclose(qtl.energy, target_Ek[:4] / 13.6 + 0.5, atol=1e-5)
+
+    def test_case(self):
+        case = Case(directory=self.directory)
+        self.assertEqual(case.case, "case")
+        np.testing.assert_allclose(case.bands.Ek, target_Ek)
+        self.assertEqual(case.bands.high_symmetry_labels[:2], ['$\\Gamma$', 'X'])
+        self.assertAlmostEqual(case.eF, 0.5)
+
+        fat = case.fatbands(atoms=[2, 3], orbitals=[[2], [3, 4]], weight=10)
+        # the parsed files are shared and not read again
+        self.assertIs(fat.qtl_data, case.qtl)
+        self.assertIs(fat.structure, case.structure)
+        self.assertIs(fat.Ek, case.bands.Ek)
+        self.assertEqual(len(fat.create_legend()), 3)
+
+        fig, ax = plt.subplots()
+        ax.fatband_plot(fat, "k-", lw=1)
+        self.assertEqual(len(ax.collections), 3)
+        plt.close(fig)
+
+        with self.assertRaises(FileNotFoundError):
+            case.rho
+
+        # concurrent requests for a cold case parse every file once
+        cold = Case(directory=self.directory)
+        with profile(memory=False) as p:
+            threads = [threading.Thread(target=lambda: cold.qtl) for _ in range(4)]
+            for t in threads: t.start()
+            for t in threads: t.join()
+        self.assertEqual(sum(r["name"] == "parse:qtl" for r in p.records), 1)
+
+    def test_fatbands_loader(self):
+        files = dict(spaghetti=os.path.join(self.directory, "case.spaghetti_ene"),
+                     klist_band=os.path.join(self.directory, "case.klist_band"),
+                     struct=os.path.join(self.directory, "case.struct"),
+                     eF=os.path.join(self.directory, "case.scf"))
+        fat = FatBands(atoms=[2], orbitals=[[2]], qtl=os.path.join(self.directory, "case.qtl"), **files)
+        np.testing.assert_allclose(fat.Ek, target_Ek)
+        self.assertAlmostEqual(fat.eF, 0.5)
+        self.assertEqual(len(fat.qtl_data), 4)
+        with self.assertRaises(FileNotFoundError):
+            FatBands(atoms=[2], orbitals=[[2]], qtl=os.path.join(self.directory, "missing.qtl"), **files)
+
+    def test_density_plot(self):
+        fat = Case(directory=self.directory).fatbands(atoms=[2], orbitals=[[2]])
+        nk = len(fat.kpoints)
+        flat = Bands.from_data(fat.kpoints, np.zeros((3, nk)), fat.high_symmetry_points, fat.high_symmetry_labels)
+        fig, ax = plt.subplots()
+        # more pixels than kpoints: every band gives one sample per column
+        ax.band_density_plot(flat, resolution=(2 * nk, 20))
+        image = ax.images[0].get_array()
+        self.assertEqual(image.shape, (20, 2 * nk))
+        self.assertTrue(np.all(image.sum(axis=0) == 3))
+        # fewer pixels than kpoints: every sample is binned
+        ax.band_density_plot(flat, resolution=(nk // 2, 20))
+        self.assertEqual(ax.images[1].get_array().sum(), 3 * nk)
+        plt.close(fig)
+
+        fig, ax = plt.subplots()
+        ax.fatband_density_plot(fat)
+        self.assertEqual(len(ax.images), 1)
+        self.assertEqual(len(ax.collections), 0)
+        plt.close(fig)
+
+    def test_blend_plot(self):
+        case = Case(directory=self.directory)
+        fat = case.fatbands(atoms=[1, 2], orbitals=[[1], [2, 3]], colors=[["r"], ["g", "b"]])
+        fig, ax = plt.subplots()
+        ax.fatband_blend_plot(fat)
+        self.assertEqual(len(ax.collections), 1)
+        lines = ax.collections[0]
+        self.assertEqual(len(lines.get_segments()), len(fat.qtl_data) * (len(fat.kpoints) - 1))
+        self.assertEqual(len(lines.get_linewidths()), len(lines.get_segments()))
+        # the lines are scaled by the weight like the markers of fatband_plot
+        light = case.fatbands(atoms=[1, 2], orbitals=[[1], [2, 3]], weight=10)
+        ax.fatband_blend_plot(light)
+        self.assertLess(np.mean(ax.collections[1].get_linewidths()), np.mean(lines.get_linewidths()))
+        plt.close(fig)
+
+    def test_fatband_grid(self):
+        fat = Case(directory=self.directory).fatbands(atoms=[1, 2], orbitals=[[2, 3], [4]])
+        fig, axes = fatband_grid(fat)
+        self.assertEqual(len(axes), 3)
+        self.assertEqual(len(fig.axes), 3)
+        self.assertTrue(all(len(ax.collections) == 2 for ax in axes))
+        plt.close(fig)
+        output = render_fatband_grid(fat, os.path.join(self.output, "grid.png"), panel_size=(2, 2), dpi=50, workers=2)
+        self.assertEqual(plt.imread(output).shape[:2], (200, 200))
+
+    def test_animation(self):
+        bands = Bands(spaghetti=spaghetti, klist_band=klist_band)
+        loaded = []
+        def load(s):
+            loaded.append(s)
+            return Bands.from_data(bands.kpoints, bands.Ek + s, bands.high_symmetry_points, bands.high_symmetry_labels)
+        frames = [lambda s=s: load(s) for s in range(4)]
+        fig, ax = plt.subplots(figsize=(2, 2))
+        anim = SeriesAnimation(frames, ax, labels=["a", "b", "c", "d"])
+        anim.save(os.path.join(self.output, "series.gif"), fps=4, dpi=20, writer="pillow")
+        # the first frame is loaded once, although it is drawn again after the artists were created
+        self.assertEqual(sorted(loaded), [0, 1, 2, 3])
+        self.assertEqual(len(anim.artists), 2)
+        np.testing.assert_allclose(anim.artists[0].get_segments()[0][:, 1], bands.Ek[0] + 3)
+        self.assertEqual(anim.artists[1].get_text(), "d")
+        self.assertEqual(len(ax.collections), 1)
+        anim.close()
+        plt.close(fig)
+
+    def test_export_policy(self):
+        bands = Bands(spaghetti=spaghetti, klist_band=klist_band)
+        fig, ax = plt.subplots()
+        ax.band_plot(bands)
+        nbands = len(bands.Ek)
+        # the single bands are light, only their total on the axes is heavy
+        self.assertEqual(len(heavy_artists(fig, max_vertices=bands.Ek.shape[1])), 0)
+        self.assertEqual(len(heavy_artists(fig, max_axes_vertices=bands.Ek.size - 1)), nbands)
+        # the high symmetry lines and the Fermi level are never rasterized
+        self.assertEqual(len(heavy_artists(fig, max_vertices=10)), nbands)
+        with export_policy(fig, max_vertices=10) as heavy:
+            self.assertTrue(all(artist.get_rasterized() for artist in heavy))
+        self.assertFalse(any(artist.get_rasterized() for artist in heavy))
+        plt.close(fig)
+
+        # long lines are simplified, also those that matplotlib draws in subslices
+        fig, ax = plt.subplots()
+        x = np.linspace(0, 1, 5000)
+        noise = np.random.default_rng(0).standard_normal((20, len(x))).cumsum(axis=1)
+        for i in range(20): ax.plot(x, np.sin(6 * x + i) + 1e-3 * noise[i])
+        threshold = plt.rcParams["path.simplify_threshold"]
+        sizes = []
+        for tolerance in [0, 0.5, 5]:
+            buffer = io.BytesIO()
+            savefig(fig, buffer, format="pdf", tolerance=tolerance)
+            sizes.append(len(buffer.getvalue()))
+        self.assertLess(sizes[1], sizes[0] / 2)
+        self.assertLess(sizes[2], sizes[1])
+        # the data and the global settings are unchanged
+        np.testing.assert_array_equal(ax.lines[0].get_xdata(), x)
+        self.assertEqual(plt.rcParams["path.simplify_threshold"], threshold)
+        plt.close(fig)
+
+    def test_dtype(self):
+        full = Case(directory=self.directory).fatbands(atoms=[2], orbitals=[[2]])
+        case = Case(directory=self.directory, dtype=np.float16)
+        fat = case.fatbands(atoms=[2], orbitals=[[2]])
+        # energies are kept in single precision
+        self.assertEqual(fat.Ek.dtype, np.float32)
+        self.assertEqual(fat.qtl_data.energy.dtype, np.float32)
+        self.assertEqual(fat.qtl_data.character(2, 2).dtype, np.float16)
+        self.assertTrue(fat.Ek.flags.c_contiguous)
+        self.assertLess(fat.nbytes, full.nbytes / 2)
+        self.assertEqual(case.nbytes, fat.nbytes)
+        np.testing.assert_allclose(fat.qtl_data.character(2, 2), full.qtl_data.character(2, 2), atol=1e-3)
+        # the Qtl shared by the case is neither copied nor compacted
+        shared = FatBands(atoms=[2], orbitals=[[2]], qtl=case.qtl, struct=case.structure, eF=case.eF,
+                          bands=case.bands, dtype=np.float32)
+        self.assertIs(shared.qtl_data, case.qtl)
+        # a parsed Qtl keeps only the plotted atoms
+        parsed = FatBands(atoms=[2], orbitals=[[2]], qtl=os.path.join(self.directory, "case.qtl"),
+                          struct=case.structure, eF=case.eF, bands=case.bands, dtype=np.float32)
+        self.assertEqual(parsed.qtl_data.energy.dtype, np.float32)
+        self.assertLess(parsed.qtl_data.nbytes, case.qtl.nbytes)
+        with self.assertRaises(KeyError):
+            parsed.qtl_data.character(3, 2)
+        # without dtype the energies are a view of the parsed character, copied once the
+        # character of the first atom is dropped
+        qtl = Qtl(os.path.join(self.directory, "case.qtl"))
+        self.assertIsNotNone(qtl.energy.base)
+        compact = qtl.compact([2])
+        self.assertEqual(compact.nbytes, compact.energy.nbytes + qtl.character(2, 2).base.nbytes)
+        self.assertFalse(np.may_share_memory(compact.energy, qtl.energy))
+
+        # without dtype the full case.qtl is kept
+        full = FatBands(atoms=[2], orbitals=[[2]], qtl=os.path.join(self.directory, "case.qtl"),
+                        struct=case.structure, eF=case.eF, bands=case.bands)
+        h5 = os.path.join(self.output, "dtype.h5")
+        full.to_hdf5(h5)
+        np.testing.assert_allclose(FatBands.from_hdf5(h5, atoms=[3], orbitals=[[2]]).qtl_data.character(3, 2),
+                                   qtl.character(3, 2))
+        full.Ry2eV = 13.605
+        self.assertNotEqual(full.qtl_energy()[0, 0], parsed.qtl_energy()[0, 0])
+        with self.assertRaises(AttributeError):
+            fat.unknown = 1
+
+    def test_shared(self):
+        fat = Case(directory=self.directory).fatbands(atoms=[2], orbitals=[[2]])
+        with fat.to_shared() as shared:
+            handle = pickle.loads(pickle.dumps(shared.handle))
+            attached = handle.attach()
+            np.testing.assert_allclose(attached.Ek, fat.Ek)
+            np.testing.assert_allclose(attached.qtl_data.character(2, 2), fat.qtl_data.character(2, 2))
+            self.assertEqual(attached.high_symmetry_labels, fat.high_symmetry_labels)
+            # views of the shared block, not copies
+            self.assertFalse(attached.Ek.flags.owndata)
+            self.assertFalse(attached.Ek.flags.writeable)
+            del attached
+            handle.detach()
+
+    def test_batch_render(self):
+        empty = os.path.join(self.output, "empty")
+        os.makedirs(empty, exist_ok=True)
+        spec = {"plot": "fatbands", "atoms": [2], "orbitals": [[2]], "dpi": 50, "outdir": self.output}
+        results = {d: (out, err) for d, out, _, err in batch_render([self.directory, empty, self.directory], spec, workers=2)}
+        self.assertIsNone(results[self.directory][1])
+        self.assertTrue(os.path.exists(results[self.directory][0]))
+        self.assertIn("FileNotFoundError", results[empty][1])
+
+    def test_compressed(self):
+        directory = self.copy_case("compressed")
+        for ext, compress in [("spaghetti_ene", gzip.open), ("qtl", lzma.open), ("struct", gzip.open)]:
+            fname = os.path.join(directory, "case." + ext)
+            with open(fname, "rb") as f, compress(fname + (".gz" if compress is gzip.open else ".xz"), "wb") as g:
+                g.write(f.read())
+            os.remove(fname)
+
+        case = Case(directory=directory)
+        self.assertTrue(case.file("qtl").endswith(".xz"))
+        np.testing.assert_allclose(case.bands.Ek, target_Ek)
+        self.assertEqual(len(case.structure), 4)
+        self.assertEqual(len(case.qtl), 4)
+
+        dft = Bands(spaghetti=case.file("spaghetti_ene"), klist_band=case.file("klist_band"))
+        np.testing.assert_allclose(dft.Ek, target_Ek)
+        # files given by the case name are found compressed as well
+        fat = FatBands(atoms=[2], orbitals=[[2]], case=os.path.join(directory, "case"))
+        self.assertTrue(fat.qtl.endswith(".xz"))
+        np.testing.assert_allclose(fat.Ek, target_Ek)
+
+        # a truncated file raises on every read instead of blocking
+        truncated = os.path.join(directory, "truncated.gz")
+        with open(case.file("spaghetti_ene"), "rb") as f, open(truncated, "wb") as g:
+            g.write(f.read()[:2000])
+        with open_file(truncated) as f:
+            for _ in range(2):
+                with self.assertRaises(EOFError):
+                    f.read()
+
+    def test_hdf5(self):
+        h5 = os.path.join(self.output, "case.h5")
+        case = Case(directory=self.directory)
+        fat = case.fatbands(atoms=[2, 3], orbitals=[[2], [3, 4]], weight=10)
+        fat.to_hdf5(h5)
+        case.bands.to_hdf5(h5)
+
+        bands = Bands.from_hdf5(h5)
+        np.testing.assert_allclose(bands.Ek, target_Ek)
+        self.assertEqual(bands.high_symmetry_labels, case.bands.high_symmetry_labels)
+        window = Bands.from_hdf5(h5, energy_window=(-1, 1))
+        self.assertTrue(0 < len(window.Ek) < len(target_Ek))
+        self.assertTrue(np.all((window.Ek.max(axis=1) >= -1) & (window.Ek.min(axis=1) <= 1)))
+
+        # only the character of the requested atoms is read
+        loaded = FatBands.from_hdf5(h5, atoms=[3], orbitals=[[4]])
+        np.testing.assert_allclose(loaded.qtl_data.character(3, 4), case.qtl.character(3, 4))
+        with self.assertRaises(KeyError):
+            loaded.qtl_data.character(2, 2)
+        self.assertEqual(loaded.structure.to_dict(), case.structure.to_dict())
+        self.assertEqual(loaded.eF, fat.eF)
+        self.assertEqual(len(FatBands.from_hdf5(h5).create_legend()), 3)
+
+    def test_server(self):
+        directory = self.copy_case("server")
+        server = make_server(port=0, max_cases=1)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        try:
+            for fmt in ["png", "svg", "png"]:
+                query = f"case={directory}&plot=fatbands&atoms=2,3&orbitals=2;3,4&format={fmt}"
+                with urllib.request.urlopen(f"{url}/plot?{query}") as response:
+                    self.assertEqual(response.headers["Content-Type"].split("/")[1][:3], fmt)
+                    self.assertGreater(len(response.read()), 0)
+            self.assertEqual(server.cache.stats()["misses"], 1)
+            self.assertEqual(server.cache.stats()["hits"], 2)
+            # a file rewritten in place invalidates the cached case
+            with open(os.path.join(directory, "case.scf"), "w") as f:
+                f.write(":FER  : F E R M I - ENERGY(TETRAH.M.)=   0.70000000000\n")
+            self.assertAlmostEqual(server.cache.get(directory).eF, 0.7)
+            for missing in [f"{directory}/missing", f"{directory}/case.scf"]:
+                with self.assertRaises(urllib.error.HTTPError) as error:
+                    urllib.request.urlopen(f"{url}/plot?case={missing}")
+                self.assertEqual(error.exception.code, 400)
+                error.exception.close()
+
+            # concurrent requests for a cold case share a single Case
+            cache, barrier, cases = CaseCache(), threading.Barrier(4), []
+            def get():
+                barrier.wait()
+                cases.append(cache.get(directory))
+            threads = [threading.Thread(target=get) for _ in range(4)]
+            for t in threads: t.start()
+            for t in threads: t.join()
+            self.assertEqual(cache.stats()["misses"], 1)
+            self.assertTrue(all(case is cases[0] for case in cases))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_profile(self):
+        with profile() as p:
+            case = Case(directory=self.directory)
+            fig, ax = plt.subplots()
+            ax.fatband_plot(case.fatbands(atoms=[2], orbitals=[[2]]))
+            fig.savefig(os.path.join(self.output, "plot.png"), dpi=50)
+            plt.close(fig)
+        stages = {r["name"]: r for r in p.records}
+        for name in ["discovery", "parse:spaghetti", "parse:klist_band", "parse:qtl", "parse:struct",
+                     "parse:scf", "artists:band_plot", "artists:fatband_plot", "render"]:
+            self.assertIn(name, stages)
+        self.assertEqual(stages["parse:qtl"]["bytes"], os.path.getsize(os.path.join(self.directory, "case.qtl")))
+        # the parsers run concurrently and have no peak memory of their own
+        self.assertIsNone(stages["parse:qtl"]["peak_memory"])
+        self.assertGreater(stages["render"]["peak_memory"], 0)
+        self.assertIn("parse:qtl", p.summary())
+        with profile() as alone:
+            Qtl(os.path.join(self.directory, "case.qtl"))
+        self.assertGreater(alone.records[0]["peak_memory"], 0)
+
+        # the stages of the batch workers are merged into the profile
+        with profile(memory=False) as batch:
+            list(batch_render([self.directory], {"dpi": 50, "outdir": self.output}, workers=1, profile=batch))
+        self.assertIn("parse:spaghetti", [r["name"] for r in batch.records])
+        self.assertNotEqual(batch.records[0]["process"], os.getpid())
+
+        trace = os.path.join(self.output, "trace.json")
+        p.to_chrome_trace(trace)
+        with open(trace) as f:
+            self.assertEqual(len(json.load(f)["traceEvents"]), len(p.records))
+
+        # nothing is recorded outside of the with block
+        nrecords = len(p.records)
+        Case(directory=self.directory).bands
+        self.assertEqual(len(p.records), nrecords)
+
+    def test_watch(self):
+        directory = self.copy_case("watch")
+        files = {ext: os.path.join(directory, "case." + ext) for ext in ["spaghetti_ene", "qtl"]}
+        contents = {}
+        for ext, fname in files.items():
+            with open(fname) as f: contents[ext] = f.read()
+            open(fname, "w").close()
+
+        fig, ax = plt.subplots()
+        watcher = FatBandsWatcher(ax, [2], [[2]], spaghetti=files["spaghetti_ene"],
+                                  klist_band=os.path.join(directory, "case.klist_band"), qtl=files["qtl"],
+                                  eF=os.path.join(directory, "case.scf"), struct=os.path.join(directory, "case.struct"))
+        self.assertEqual(watcher.update(), 0)
+
+        # write the first three bands and the first half of the fourth band
+        spag = contents["spaghetti_ene"]
+        cut = [i for i in range(len(spag)) if spag.startswith("  bandindex", i)][3] + 5000
+        with open(files["spaghetti_ene"], "a") as f: f.write(spag[:cut])
+        self.assertEqual(watcher.update(), 3)
+        self.assertEqual(len(ax.lines) - len(watcher.artists), 9)    # decoration
+        with open(files["spaghetti_ene"], "a") as f: f.write(spag[cut:])
+        self.assertEqual(watcher.update(), len(target_Ek) - 3)
+        np.testing.assert_allclose(ax.lines[-1].get_ydata(), target_Ek[-1])
+
+        with open(files["qtl"], "a") as f: f.write(contents["qtl"])
+        self.assertEqual(watcher.update(), 4)
+        self.assertEqual(len(ax.collections), 1)
+        plt.close(fig)
+
     def test_examples(self):
 
         def la112sp():
@@ -2,3 +2,5 @@ from pkg_resources import resource_filename
 
 w2kplot_base_style = resource_filename("w2kplot", "w2kplot_base.mplstyle")
 w2kplot_bands_style = resource_filename("w2kplot", "w2kplot_bands.mplstyle")
+
+from .profiling import profile
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+##########################################################################
+#
+# w2kplot: a thin Python wrapper around matplotlib
+#
+# Copyright (C) 2022 Harrison LaBollita
+# Authors: H. LaBollita
+#
+# w2kplot is free software licensed under the terms of the MIT license.
+#
+##########################################################################
+
+import types
+import numpy as np
+import matplotlib.pyplot as plt
+from concurrent.futures import ThreadPoolExecutor
+from matplotlib.animation import FuncAnimation
+from matplotlib.collections import LineCollection
+from typing import List, Sequence
+
+from .bands import Bands, FatBands, decorate_band_plot
+
+
+class _Prefetch(object):
+    """loads the frames of a series in a background thread, a few frames ahead
+       of the one being drawn. A frame is either a data object or a callable
+       without arguments returning one, e.g., lambda: Case(directory).bands.
+    """
+
+    def __init__(self, frames: Sequence, ahead: int = 2) -> None:
+        self.frames = frames
+        self.ahead = ahead
+        self._pool = ThreadPoolExecutor(max_workers=1)
+        self._futures = {}
+
+    @staticmethod
+    def _load(frame):
+        return frame() if callable(frame) else frame
+
+    def __len__(self): return len(self.frames)
+
+    def __getitem__(self, i: int):
+        for j in range(i, min(i + self.ahead + 1, len(self.frames))):
+            if j not in self._futures:
+                self._futures[j] = self._pool.submit(self._load, self.frames[j])
+        frame = self._futures[i].result()
+        # keep only the frames ahead and the first frame, which is drawn again by
+        # the animation after the artists were created and on every repeat
+        for j in [j for j in self._futures if 0 < j <= i]: del self._futures[j]
+        return frame
+
+    def close(self) -> None: self._pool.shutdown(wait=False)
+
+
+class SeriesAnimation(object):
+    def __init__(self,
+                 frames: Sequence,
+                 figure=None,
+                 labels: List[str] = None,
+                 column: int = 1,
+                 prefetch: int = 2,
+                 interval: int = 200,
+                 blit: bool = True,
+                 lw: float = 1.0,
+                 color: str = "k") -> None:
+        """
+        Animate a series of Bands, FatBands or DensityOfStates, e.g., a pressure, strain or
+        doping scan on a common k-path. The artists are created once for the first frame
+        and only their data is updated for the following frames, which are loaded in a
+        background thread while the current frame is drawn.
+
+        Parameters
+        ----------
+        frames     : list, required
+                     Bands, FatBands or DensityOfStates objects, or callables without arguments
+                     returning one, e.g., lambda: Case(directory).bands, which are loaded lazily.
+        figure     : matplotlib.axes.Axes or matplotlib.pyplot, optional
+                     where to plot. Default is the current axes.
+        labels     : list[string], optional
+                     text shown in the corner of each frame, e.g., the pressure.
+        column     : int, optional
+                     column of the DensityOfStates to plot against the energy.
+        prefetch   : int, optional
+                     number of frames loaded ahead.
+        interval   : int, optional
+                     delay between frames in ms when shown on screen.
+        blit       : bool, optional
+                     redraw only the animated artists when shown on screen.
+        lw         : float, optional
+                     line width of the bands or the density of states.
+        color      : string, optional
+                     color of the bands or the density of states.
+        """
+        if figure is None or isinstance(figure, types.ModuleType):
+            figure = plt.gca()
+        self.figure = figure
+        self.labels = labels
+        self.column = column
+        self.frames = _Prefetch(frames, prefetch)
+
+        first = self.frames[0]
+        if isinstance(first, FatBands):
+            self._create = self._create_fatbands
+            self._update = self._update_fatbands
+        elif isinstance(first, Bands):
+            self._create = self._create_bands
+            self._update = self._update_bands
+        else:
+            self._create = self._create_dos
+            self._update = self._update_dos
+        self.artists = self._create(first, lw, color)
+        if labels is not None:
+            self._label = figure.text(0.02, 0.96, labels[0], transform=figure.transAxes, va="top")
+            self.artists.append(self._label)
+        for artist in self.artists: artist.set_animated(blit)
+
+        self.animation = FuncAnimation(figure.figure, self._draw_frame, frames=len(self.frames),
+                                       init_func=lambda: self.artists, interval=interval, blit=blit)
+
+    def _draw_frame(self, i: int):
+        frame = self.frames[i]
+        self._update(frame)
+        if self.labels is not None: self._label.set_text(self.labels[i])
+        return self.artists
+
+    @staticmethod
+    def _segments(bands: Bands) -> np.ndarray:
+        k = np.broadcast_to(bands.kpoints, bands.Ek.shape)
+        return np.stack([k, bands.Ek - bands.eF_shift], axis=-1)
+
+    def _create_bands(self, bands: Bands, lw: float, color: str) -> List:
+        self._lines = LineCollection(self._segments(bands), colors=color, linewidths=lw)
+        self.figure.add_collection(self._lines)
+        decorate_band_plot(self.figure, bands)
+        return [self._lines]
+
+    def _update_bands(self, bands: Bands) -> None:
+        self._lines.set_segments(self._segments(bands))
+
+    def _create_fatbands(self, fat_bands: FatBands, lw: float, color: str) -> List:
+        artists = self._create_bands(fat_bands, lw, color)
+        self._scatter = []
+        for (a, at) in enumerate(fat_bands.atoms):
+            for o in range(len(fat_bands.orbitals[a])):
+                self._scatter.append(self.figure.scatter([], [], [], fat_bands.colors[a][o], rasterized=True))
+        self._update_fatbands(fat_bands)
+        return artists + self._scatter
+
+    def _update_fatbands(self, fat_bands: FatBands) -> None:
+        self._update_bands(fat_bands)
+        qtl = fat_bands.qtl_data
+        E = fat_bands.qtl_energy()
+        offsets = np.column_stack([np.tile(fat_bands.kpoints, len(E)), E.ravel()])
+        scatter = iter(self._scatter)
+        for (a, at) in enumerate(fat_bands.atoms):
+            enh = float(fat_bands.weight * fat_bands.structure.atoms[at - 1][1])
+            for orb in fat_bands.orbitals[a]:
+                s = next(scatter)
+                s.set_offsets(offsets)
+                s.set_sizes(enh * qtl.character(at, orb).ravel())
+
+    def _create_dos(self, dos, lw: float, color: str) -> List:
+        self._line, = self.figure.plot(dos[:, 0], dos[:, self.column], lw=lw, color=color)
+        self.figure.axvline(0.0, color='k', lw=1, ls='dotted')
+        self.figure.axhline(0.0, color='k', lw=1, ls='dotted')
+        return [self._line]
+
+    def _update_dos(self, dos) -> None:
+        self._line.set_data(dos[:, 0], dos[:, self.column])
+
+    def save(self, filename: str, fps: int = 10, dpi: int = 150, writer=None, **kwargs) -> None:
+        """
+        Encode the animation to filename, e.g., a .mp4 (requires ffmpeg) or .gif file.
+
+        Parameters
+        ----------
+        filename   : string, required
+                     output file.
+        fps        : int, optional
+                     frames per second.
+        dpi        : int, optional
+                     resolution of the frames.
+        writer     : string or matplotlib.animation.MovieWriter, optional
+                     Default is chosen by matplotlib from the extension of filename.
+        kwargs     : optional
+                     passed to matplotlib.animation.Animation.save.
+        """
+        self.animation.save(filename, fps=fps, dpi=dpi, writer=writer, **kwargs)
+
+    def close(self) -> None:
+        """
+        Stop loading frames in the background.
+        """
+        self.frames.close()
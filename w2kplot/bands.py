@@ -11,27 +11,36 @@
 #
 ##########################################################################
 
-import glob
+import os
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib as mpl
 from matplotlib.lines import Line2D
+from matplotlib.collections import LineCollection
 import types
 from typing import Union, List, Dict
 
 from .structure import Structure
-from .utils import make_label
+from .qtl import Qtl
+from .utils import make_label, load_concurrently, open_file, find_files, case_file, compact_array
+from .profiling import timed
+from .hdf5 import open_group, write_dataset, write_meta, read_meta, window_slice
+from .shared import Shareable
 
 from . import w2kplot_base_style, w2kplot_bands_style
 
 
 # Bands class
-class Bands(object):
+class Bands(Shareable):
+    __slots__ = ("spaghetti", "klist_band", "eF_shift", "dtype", "kpoints", "Ek",
+                 "high_symmetry_points", "high_symmetry_labels")
+
     def __init__(self,
                  case: str = None,
                  spaghetti: str = None,
                  klist_band: str = None,
-                 eF_shift: float = 0) -> None:
+                 eF_shift: float = 0,
+                 dtype=None) -> None:
         """
         Initialize the Bands w2kplot object.
 
@@ -44,85 +53,133 @@ class Bands(object):
                      the high symmetry points and high symmetry labels.
         eF_shift   : float, optional
                      Optional parameter to shift the Fermi energy. Units are eV.
+        dtype      : numpy dtype, optional
+                     dtype of kpoints and εk, e.g., np.float32. float16 is promoted to float32
+                     for energies. Default is float64. The memory used is nbytes.
         """
-        self.spaghetti = case + '.spaghetti_ene' if case else spaghetti
-        self.klist_band = case + '.klist_band' if case else klist_band
+        self._find_files(case, spaghetti, klist_band)
         self.eF_shift = eF_shift
+        self.dtype = dtype
+        self._set_bands(self._parse_bands(), self._parse_klist_band())
+
+    def _find_files(self, case: str, spaghetti: str, klist_band: str) -> None:
+        """
+        Internal function to determine the case.spaghetti_ene and case.klist_band files.
+        """
+        self.spaghetti = case_file(case, '.spaghetti_ene') if case else spaghetti
+        self.klist_band = case_file(case, '.klist_band') if case else klist_band
 
         if self.spaghetti is None:
             try:
-                self.spaghetti = glob.glob("*.spaghetti_ene")[0]
+                self.spaghetti = find_files("*.spaghetti_ene")[0]
             except BaseException:
                 raise FileNotFoundError(
                     "Could not find a case.spaghetti_ene file in this directory.\nPlease provide a case.spaghetti_ene file")
 
         if self.klist_band is None:
             try:
-                self.klist_band = glob.glob("*.klist_band")[0]
+                self.klist_band = find_files("*.klist_band")[0]
             except BaseException:
                 raise FileNotFoundError(
                     "Could not find a case.klist_band file in this directory.\nPlease provide a case.klist_band file")
+
+    # methods for parsing the spaghetti_ene file and the klist_band file
+    def _parse_bands(self):
         try:
-            self.kpoints, self.Ek = self._get_dft_bands()
+            return self._get_dft_bands()
         except BaseException:
             raise Exception("Error in parsing bands!")
+
+    def _parse_klist_band(self):
         try:
-            self.high_symmetry_points, self.high_symmetry_labels = self._get_high_symmetry_path()
+            return self._read_klist_band(self.klist_band)
         except BaseException:
             raise Exception("Error in parsing klist_band file!")
 
-    # methods for parsing the spaghetti_ene file and the klist_band file
+    def _set_bands(self, bands, path) -> None:
+        """
+        Internal function to store the parsed εk and high symmetry path.
+        """
+        kpoints, Ek = bands
+        self.kpoints = compact_array(kpoints, self.dtype, energy=True)
+        self.Ek = compact_array(Ek, self.dtype, energy=True)
+        indices, self.high_symmetry_labels = path
+        self.high_symmetry_points = [float(self.kpoints[ind]) for ind in indices]
+
+    @property
+    def nbytes(self) -> int:
+        """
+        memory used by kpoints and εk, in bytes.
+        """
+        return self.kpoints.nbytes + self.Ek.nbytes
+
     def _get_dft_bands(self):
         """
         Internal function to parse the provided case.spaghetti/up/dn_ene file.
         """
-        try:
-            f = open(self.spaghetti, "r"); f.close()
-        except BaseException:
+        if not os.path.exists(self.spaghetti):
             raise FileNotFoundError(
                 "Could not find a case.spaghetti_ene file in this directory.\nPlease provide a case.spaghetti_ene file")
-        try:
-            f = open(self.klist_band, "r");f.close()
-        except BaseException:
+        if not os.path.exists(self.klist_band):
             raise FileNotFoundError(
                 "Could not find a case.klist_band file in this directory\n. Please provide a valid case.klist_band file")
 
+        return self._read_spaghetti(self.spaghetti)
+
+    @staticmethod
+    @timed("parse:spaghetti", filename=lambda spaghetti: spaghetti)
+    def _read_spaghetti(spaghetti: str):
+        """
+        Internal function to read the kpoints and εk from a case.spaghetti/up/dn_ene file.
+
+        Parameters
+        ----------
+        spaghetti  : string, required
+                     Filename of case.spaghetti/up/dn_ene.
+        """
+        # decompress once, the header is skipped by retrying on the lines in memory
+        with open_file(spaghetti) as f:
+            lines = f.readlines()
         skiprows = 0
         while True:
             try:
-                data = np.loadtxt(self.spaghetti, comments="bandindex", skiprows=skiprows)
+                data = np.loadtxt(lines, comments="bandindex", skiprows=skiprows)
                 kpoints = np.unique(data[:, 3])
                 Ek = data[:, 4].reshape(int(len(data) / len(kpoints)), len(kpoints))
                 break
             except BaseException:
                 skiprows += 1
+                if skiprows >= len(lines): raise
 
         return kpoints, Ek
 
-    def _get_high_symmetry_path(self):
+    @staticmethod
+    @timed("parse:klist_band", filename=lambda klist_band: klist_band)
+    def _read_klist_band(klist_band: str):
         """
-        Internal function to parse the case.klist_band file for high symmetry points and
-        high symmetry labels.
+        Internal function to read the indices of the high symmetry points and their
+        labels from a case.klist_band file.
+
+        Parameters
+        ----------
+        klist_band : string, required
+                     Filename of case.klist_band.
         """
         high_symmetry_points, high_symmetry_labels = [], []
-        f = open(self.klist_band)
-        klist_band = f.readlines()
+        f = open_file(klist_band)
+        contents = f.readlines()
         f.close()
 
-        try:
-            for il, line in enumerate(klist_band):
-                if line[:3] == "END": break
-                if line[:10].split():
-                    high_symmetry_labels.append(self._arg2latex(line.strip().split()[0]))
-                    high_symmetry_points.append(il)
-            high_symmetry_points = [self.kpoints[ind] for ind in high_symmetry_points]
-        except BaseException:
-            raise Exception(
-                "An error occured when trying to parse the {} file".format(self.klist_band))
+        for il, line in enumerate(contents):
+            if line[:3] == "END": break
+            if line[:10].split():
+                high_symmetry_labels.append(Bands._arg2latex(line.strip().split()[0]))
+                high_symmetry_points.append(il)
 
         return high_symmetry_points, high_symmetry_labels
 
-    def _arg2latex(self, string: str) -> str:
+    @staticmethod
+    def _arg2latex(string: str) -> str:
         """
         Internal function to convert labels parsed from case.klist_band to
         LaTeX format.
@@ -140,36 +197,173 @@ class Bands(object):
         str_in_char = string in special_chars.keys()
         return special_chars[string] if str_in_char else string
 
+    @staticmethod
+    def from_data(kpoints: np.ndarray,
+                  Ek: np.ndarray,
+                  high_symmetry_points: List[float],
+                  high_symmetry_labels: List[str],
+                  eF_shift: float = 0,
+                  spaghetti: str = None,
+                  klist_band: str = None,
+                  dtype=None):
+        """
+        Build a Bands object from already parsed data, without touching any file.
+
+        Parameters
+        ----------
+        kpoints              : np.ndarray, required
+                               kpoints along the path.
+        Ek                   : np.ndarray, required
+                               εk of shape (nbands, nkpoints).
+        high_symmetry_points : list[float], required
+                               position of the high symmetry points along the path.
+        high_symmetry_labels : list[string], required
+                               labels of the high symmetry points.
+        eF_shift             : float, optional
+                               Optional parameter to shift the Fermi energy. Units are eV.
+        spaghetti            : string, optional
+                               Filename the data originates from.
+        klist_band           : string, optional
+                               Filename the high symmetry path originates from.
+        dtype                : numpy dtype, optional
+                               dtype of kpoints and εk, see Bands.
+        """
+        bands = Bands.__new__(Bands)
+        bands.spaghetti = spaghetti
+        bands.klist_band = klist_band
+        bands.eF_shift = eF_shift
+        bands.dtype = dtype
+        bands.kpoints = compact_array(kpoints, dtype, energy=True)
+        bands.Ek = compact_array(Ek, dtype, energy=True)
+        bands.high_symmetry_points = list(high_symmetry_points)
+        bands.high_symmetry_labels = list(high_symmetry_labels)
+        return bands
+
+    def to_hdf5(self, filename: str, path: str = "bands") -> None:
+        """
+        Store the bands in the group path of the HDF5 file filename.
+
+        Parameters
+        ----------
+        filename   : string, required
+                     Filename of the HDF5 file. It is created if it does not exist.
+        path       : string, optional
+                     Name of the group inside the file.
+        """
+        with open_group(filename, path, "a") as group:
+            self._write_hdf5(group)
+
+    def _write_hdf5(self, group, **meta) -> None:
+        write_dataset(group, "kpoints", self.kpoints)
+        write_dataset(group, "Ek", self.Ek, chunks=(16, len(self.kpoints)))
+        # the energy range of each band, used to read only the bands inside an energy window
+        write_dataset(group, "Ek_min", self.Ek.min(axis=1))
+        write_dataset(group, "Ek_max", self.Ek.max(axis=1))
+        write_meta(group,
+                   high_symmetry_points=[float(k) for k in self.high_symmetry_points],
+                   high_symmetry_labels=list(self.high_symmetry_labels),
+                   eF_shift=self.eF_shift,
+                   spaghetti=self.spaghetti,
+                   klist_band=self.klist_band,
+                   **meta)
+
+    def _shared_arrays(self):
+        return ({"kpoints": self.kpoints, "Ek": self.Ek},
+                {"high_symmetry_points": [float(k) for k in self.high_symmetry_points],
+                 "high_symmetry_labels": list(self.high_symmetry_labels),
+                 "eF_shift": self.eF_shift,
+                 "spaghetti": self.spaghetti,
+                 "klist_band": self.klist_band})
+
+    @staticmethod
+    def _from_shared(arrays, meta):
+        return Bands.from_data(arrays["kpoints"], arrays["Ek"],
+                               meta["high_symmetry_points"],
+                               meta["high_symmetry_labels"],
+                               eF_shift=meta["eF_shift"],
+                               spaghetti=meta["spaghetti"],
+                               klist_band=meta["klist_band"])
+
+    @staticmethod
+    def from_hdf5(filename: str, path: str = "bands", energy_window=None):
+        """
+        Load bands stored with to_hdf5.
+
+        Parameters
+        ----------
+        filename      : string, required
+                        Filename of the HDF5 file.
+        path          : string, optional
+                        Name of the group inside the file.
+        energy_window : tuple(float, float), optional
+                        (lower, upper) energy in eV relative to the Fermi energy. Only the bands with
+                        at least one energy inside the window are read from the file.
+        """
+        with open_group(filename, path) as group:
+            return Bands._read_hdf5(group, energy_window)
+
+    @staticmethod
+    def _read_hdf5(group, energy_window=None):
+        meta = read_meta(group)
+        rows = window_slice(group["Ek_min"][()] - meta["eF_shift"],
+                            group["Ek_max"][()] - meta["eF_shift"], energy_window)
+        return Bands.from_data(group["kpoints"][()],
+                               group["Ek"][rows],
+                               meta["high_symmetry_points"],
+                               meta["high_symmetry_labels"],
+                               eF_shift=meta["eF_shift"],
+                               spaghetti=meta["spaghetti"],
+                               klist_band=meta["klist_band"])
+
     @staticmethod
     def Up(case=None, **kwargs):
         if case is None:
             try:
-                spaghetti = glob.glob("*.spaghettiup_ene")[0]
+                spaghetti = find_files("*.spaghettiup_ene")[0]
             except BaseException:
                 raise FileNotFoundError(
                     "Could not find a case.spaghettiup_ene file in this directory.\nPlease provide a case.spaghettiup_ene file")
             return Bands(spaghetti=spaghetti, **kwargs)
         else:
-            return Bands(spaghetti=case + '.spaghettiup_ene', klist_band=case + '.klist_band', **kwargs)
+            return Bands(spaghetti=case_file(case, '.spaghettiup_ene'), klist_band=case_file(case, '.klist_band'), **kwargs)
 
     @staticmethod
     def Down(case=None, **kwargs):
         if case is None:
             try:
-                spaghetti = glob.glob("*.spaghettidn_ene")[0]
+                spaghetti = find_files("*.spaghettidn_ene")[0]
             except BaseException:
                 raise FileNotFoundError(
                     "Could not find a case.spaghettidn_ene file in this directory.\nPlease provide a case.spaghetti_ene file")
             return Bands(spaghetti=spaghetti, **kwargs)
         else:
-            return Bands(spaghetti=case + '.spaghettidn_ene', klist_band=case + '.klist_band', **kwargs)
+            return Bands(spaghetti=case_file(case, '.spaghettidn_ene'), klist_band=case_file(case, '.klist_band'), **kwargs)
 
 # bandstructure plotting
+@timed("artists:band_plot")
 def __band_plot(figure, bands, *opt_list, **opt_dict):
 
     if isinstance(figure, types.ModuleType):
         figure = figure.gca()
 
+    # plot the the dispersion from the bands object
+    for b in range(len(bands.Ek)): figure.plot(bands.kpoints, bands.Ek[b, :] - bands.eF_shift, *opt_list, **opt_dict)
+
+    decorate_band_plot(figure, bands)
+
+
+def decorate_band_plot(figure, bands):
+    """
+    Decorate the axes of a band structure plot with the high symmetry points and labels
+    of bands, the Fermi level and the axis label.
+
+    Parameters
+    ----------
+    figure     : matplotlib.axes.Axes, required
+                 the axes to decorate.
+    bands      : Bands, required
+                 object with high_symmetry_points and high_symmetry_labels.
+    """
     try:
         # new version of matplotlib
         grid_spec = figure.get_subplotspec()
@@ -183,9 +377,6 @@ def __band_plot(figure, bands, *opt_list, **opt_dict):
     figure.tick_params(axis='both',which='minor',length=3.5,width=0.5,labelsize=12,bottom=False,top=False)
     figure.tick_params(axis='both', which='major',length=7, width=0.5, labelsize=12, bottom=False, top=False)
 
-    # plot the the dispersion from the bands object
-    for b in range(len(bands.Ek)): figure.plot(bands.kpoints, bands.Ek[b, :] - bands.eF_shift, *opt_list, **opt_dict)
-
     # decorate the figure from here
     figure.set_xticks(bands.high_symmetry_points)
     if is_last_row:
@@ -209,8 +400,104 @@ plt.style.use([w2kplot_base_style, w2kplot_base_style])
 mpl.axes.Axes.band_plot = lambda self, bands, *opt_list, **opt_dict: __band_plot(self, bands, *opt_list, **opt_dict)
 
 
+def _density_image(figure, kpoints, Ek, weights=None, energy_window=(-2, 2), resolution=None):
+    """
+    Internal function to bin the (k, E) samples of all bands, weighted by weights,
+    into a 2D histogram with one bin per pixel of the axes.
+
+    Parameters
+    ----------
+    figure        : matplotlib.axes.Axes, required
+                    the axes, which sets the default resolution.
+    kpoints       : np.ndarray, required
+                    kpath of shape (nkpoints,).
+    Ek            : np.ndarray, required
+                    energies (eV) of shape (nbands, nkpoints).
+    weights       : np.ndarray, optional
+                    weight of every sample, same shape as Ek. Default counts the samples.
+    energy_window : tuple(float, float), optional
+                    (lower, upper) energy of the image.
+    resolution    : tuple(int, int), optional
+                    number of (k, E) bins. Default is the size of the axes in pixels.
+
+    Returns
+    -------
+    image         : np.ndarray
+                    histogram of shape (nE, nk).
+    extent        : list[float]
+                    extent of the image for imshow.
+    """
+    if resolution is None:
+        bbox = figure.get_window_extent()
+        resolution = (max(int(bbox.width), 1), max(int(bbox.height), 1))
+    nx, ny = resolution
+    kmin, kmax = kpoints[0], kpoints[-1]
+    emin, emax = energy_window
+
+    if len(kpoints) < nx:
+        # fewer kpoints than pixels: sample every band at the center of each column,
+        # such that the bands stay continuous
+        kx = kmin + (np.arange(nx) + 0.5) * (kmax - kmin) / nx
+        i = np.clip(np.searchsorted(kpoints, kx), 1, len(kpoints) - 1)
+        dk = kpoints[i] - kpoints[i - 1]
+        t = np.divide(kx - kpoints[i - 1], dk, out=np.zeros_like(kx), where=dk > 0)
+        Ek = (1 - t) * Ek[:, i - 1] + t * Ek[:, i]
+        if weights is not None: weights = (1 - t) * weights[:, i - 1] + t * weights[:, i]
+        col = np.arange(nx)
+    else:
+        col = np.minimum(((kpoints - kmin) / (kmax - kmin) * nx).astype(int), nx - 1)
+
+    row = np.floor((Ek - emin) / (emax - emin) * ny).astype(int)
+    inside = (row >= 0) & (row < ny)
+    index = (row * nx + col)[inside]
+    image = np.bincount(index, weights=None if weights is None else weights[inside], minlength=nx * ny)
+    return image.reshape(ny, nx), [kmin, kmax, emin, emax]
+
+
+@timed("artists:band_density_plot")
+def __band_density_plot(figure, bands, energy_window=(-2, 2), resolution=None, **opt_dict):
+
+    if isinstance(figure, types.ModuleType):
+        figure = figure.gca()
+
+    image, extent = _density_image(figure, bands.kpoints, bands.Ek - bands.eF_shift,
+                                   energy_window=energy_window, resolution=resolution)
+    opt_dict.setdefault("cmap", "Greys")
+    figure.imshow(image, origin="lower", extent=extent, aspect="auto", interpolation="nearest", **opt_dict)
+
+    decorate_band_plot(figure, bands)
+    figure.set_ylim(*energy_window)
+
+
+# band_density_plot functions
+plt.style.use([w2kplot_base_style, w2kplot_base_style])
+def band_density_plot(bands, energy_window=(-2, 2), resolution=None, **opt_dict):
+    __band_density_plot(plt, bands, energy_window, resolution, **opt_dict)
+plt.style.use([w2kplot_base_style, w2kplot_base_style])
+mpl.axes.Axes.band_density_plot = lambda self, bands, energy_window=(-2, 2), resolution=None, **opt_dict: \
+    __band_density_plot(self, bands, energy_window, resolution, **opt_dict)
+
+
+# default colors of the orbitals of each atom
+default_colors = [["dodgerblue", "lightcoral", "gold", "forestgreen", "magenta"],
+                  ["b", "r", "g", "y", "c"],
+                  ["royalblue", "salmon", "lawngreen", "orange", "deeppink"]]
+
+
+def get_default_colors(atoms: List[int], orbitals: List[List[int]]) -> List[List[str]]:
+    return [[default_colors[ia % len(default_colors)][o % len(default_colors[0])]
+             for o in orbitals[ia]]
+            for (ia, a) in enumerate(atoms)]
+
+
+# convert from Ry (wien2k default) to eV
+Ry2eV = 13.6
+
+
 # FatBands class
 class FatBands(Bands):
+    __slots__ = ("default_colors", "Ry2eV", "atoms", "orbitals", "weight", "colors", "qtl", "eF", "structure", "_qtl_data")
+
     def __init__(self,
                  atoms: List[int],
                  orbitals: List[List[int]],
@@ -219,10 +506,12 @@ class FatBands(Bands):
                  case: str = None,
                  spaghetti: str = None,
                  klist_band: str = None,
-                 qtl: str = None,
+                 qtl: Union[str, Qtl] = None,
                  eF: Union[str, float] = None,
-                 struct: str = None,
-                 eF_shift: float = 0) -> None:
+                 struct: Union[str, Structure] = None,
+                 eF_shift: float = 0,
+                 bands: Bands = None,
+                 dtype=None) -> None:
         """
         Initialize the FatBand data object. This class is a child of the Bands class.
 
@@ -245,21 +534,26 @@ class FatBands(Bands):
         klist_band  : string, optional
                       Filename of case.klist_band containing the kpoint information, specifically,
                       the high symmetry points and high symmetry labels.
-        qtl         : string, optional
+        qtl         : string or Qtl, optional
                       Filename of the case.qtl file which contains all of the information about the orbital
-                      character of the bands.
+                      character of the bands, or an already parsed Qtl object.
         eF          : string or float, optional
                       The Fermi energy in Rydbergs. Needed to match the orbital weight to the band structure.
-        struct      : string, optional
-                      Filename of the case.struct file. Used to created a legend for the figure.
+        struct      : string or Structure, optional
+                      Filename of the case.struct file, or an already parsed Structure object.
+                      Used to created a legend for the figure.
         eF_shit     : float, optional
                       Optional parameter to shift the Fermi energy. Units are eV.
+        bands       : Bands, optional
+                      An already parsed Bands object. If provided, the case.spaghetti_ene and case.klist_band
+                      files are not read again.
+        dtype       : numpy dtype, optional
+                      dtype of the εk and the orbital character, e.g., np.float32 or np.float16 (the energies
+                      are kept in at least single precision). If given, only the character of atoms is kept.
+                      Default is float64 and the full case.qtl. The memory used is nbytes.
         """
-        super().__init__(case, spaghetti, klist_band, eF_shift)
-
-        self.default_colors = [["dodgerblue", "lightcoral", "gold", "forestgreen", "magenta"],
-                               ["b", "r", "g", "y", "c"],
-                               ["royalblue", "salmon", "lawngreen", "orange", "deeppink"]]
+        self.default_colors = default_colors
+        self.Ry2eV = Ry2eV
 
         self.atoms = atoms
         self.orbitals = orbitals
@@ -267,49 +561,120 @@ class FatBands(Bands):
         self.colors = colors
 
         # modify file names if case is available
-        struct = case + '.struct' if case else struct
-        qtl = case + '.qtl' if case else qtl
-        eF = case + '.scf' if case and not isinstance(eF, float) else eF
+        struct = case_file(case, '.struct') if case and struct is None else struct
+        qtl = case_file(case, '.qtl') if case and qtl is None else qtl
+        eF = case_file(case, '.scf') if case and not isinstance(eF, float) else eF
 
         assert len(self.atoms) == len(
             self.orbitals), f"list of atoms does not match list of orbitals: {len(atoms)} != {len(orbitals)}"
 
         if colors is None:
-            self.colors = [[self.default_colors[ia % len(self.default_colors)][o % len(self.default_colors[0])]
-                            for o in self.orbitals[ia]]
-                           for (ia, a) in enumerate(self.atoms)]
+            self.colors = get_default_colors(self.atoms, self.orbitals)
         assert len(self.atoms) == len(
             self.colors), f"list of atoms does not match list of colors: {len(atoms)} != {len(colors)}"
 
-        self.Ry2eV = 13.6          # convert from Ry (wien2k default) to eV
+        self.eF_shift = eF_shift
+        self.dtype = dtype
         self.qtl = qtl
         self.eF = eF
-        self.structure = Structure(struct)
+        self._qtl_data = None
+
+        if isinstance(self.qtl, Qtl):
+            self._qtl_data = self.qtl
+            self.qtl = self._qtl_data.filename
+
+        # determine all the files first, then read them concurrently
+        if bands is None:
+            self._find_files(case, spaghetti, klist_band)
 
         if self.qtl is None:
             try:
-                self.qtl = glob.glob("*.qtl")[0]
+                self.qtl = find_files("*.qtl")[0]
             except BaseException:
                 raise FileNotFoundError(
                     "Could not find a case.qtl file in this directory. Please provide a case.qtl file")
 
         if self.eF is None:
             try:
-                scf = open(glob.glob("*.scf")[0])
-                self.eF = float([line for line in scf.readlines() if ":FER" in line][-1].split()[-1].strip())
-                scf.close()
+                self.eF = find_files("*.scf")[0]
             except BaseException:
                 raise FileNotFoundError("Could not find a case.scf file in this directory.\nThis file is needed to determine the Fermi energy.\
                                          You can instead simply provide this quantity upon initialization.")
 
+        loaders = {}
+        if bands is None:
+            loaders["bands"] = self._parse_bands
+            loaders["path"] = self._parse_klist_band
+        if not isinstance(struct, Structure):
+            loaders["structure"] = lambda: Structure(struct)
         if isinstance(self.eF, str):
-            scf = open(self.eF)
-            self.eF = float([line for line in scf.readlines()
-                             if ":FER" in line][-1].split()[-1].strip())
-            scf.close()
+            loaders["eF"] = lambda: self._read_fermi_energy(self.eF)
+        if self._qtl_data is None:
+            loaders["qtl"] = lambda: Qtl(self.qtl, dtype)
+        data = load_concurrently(loaders)
+
+        if bands is None:
+            self._set_bands(data["bands"], data["path"])
+        else:
+            self.spaghetti, self.klist_band = bands.spaghetti, bands.klist_band
+            self.kpoints = compact_array(bands.kpoints, dtype, energy=True)
+            self.Ek = compact_array(bands.Ek, dtype, energy=True)
+            self.high_symmetry_points = bands.high_symmetry_points
+            self.high_symmetry_labels = bands.high_symmetry_labels
+        self.structure = data.get("structure", struct)
+        self.eF = data.get("eF", self.eF)
+        # with dtype, a Qtl parsed here keeps only the plotted atoms, one given by the caller is used as is
+        if "qtl" in data and dtype is not None:
+            self._qtl_data = data["qtl"].compact(self.atoms)
 
         assert isinstance(self.eF, float), "Please provide the Fermi energy from the scf file or provide the scf file!"
 
+    @staticmethod
+    @timed("parse:scf", filename=lambda scf: scf)
+    def _read_fermi_energy(scf: str) -> float:
+        """
+        Internal function to read the Fermi energy (Ry) from the last :FER line of a case.scf file.
+
+        Parameters
+        ----------
+        scf         : string, required
+                      Filename of case.scf.
+        """
+        f = open_file(scf)
+        eF = float([line for line in f.readlines() if ":FER" in line][-1].split()[-1].strip())
+        f.close()
+        return eF
+
+    @property
+    def qtl_data(self) -> Qtl:
+        """
+        the parsed case.qtl file.
+        """
+        if self._qtl_data is None:
+            self._qtl_data = Qtl(self.qtl, self.dtype)
+        return self._qtl_data
+
+    def qtl_energy(self) -> np.ndarray:
+        """
+        Energy of every band at every kpoint of the case.qtl, in eV relative to the
+        Fermi energy and shifted by eF_shift.
+
+        Returns
+        -------
+        energy      : np.ndarray
+                      array of shape (nbands, nkpoints).
+        """
+        qtl = self.qtl_data
+        assert len(self.kpoints) == qtl.nkpoints, f"Did not parse file correctly! {len(self.kpoints), qtl.nkpoints}"
+        return qtl_to_eV(qtl.energy, self.eF, self.eF_shift, self.Ry2eV)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        memory used by kpoints, εk and the orbital character, in bytes.
+        """
+        return super().nbytes + self.qtl_data.nbytes
+
     def _get_orbital_labels(self, atom: int, orbs: List[int]) -> List[str]:
         """
         convert the orbital labels in the case.qtl file into LaTeX format.
@@ -343,13 +708,113 @@ class FatBands(Bands):
                    "3": "$f$",
                    "tot": "Total",
                    }
-        qtl_file = open(self.qtl)
-        orbitals = [line for line in qtl_file.readlines() if "JATOM" in line]
-        qtl_file.close()
-        orbs_for_atom = orbitals[atom - 1].split()[-1].split(",")
+        orbs_for_atom = self.qtl_data.orbitals[atom - 1]
         labels = [qtl2orb[orbs_for_atom[int(orbs[o]) - 1]] for o in range(len(orbs))]
         return labels
 
+    def to_hdf5(self, filename: str, path: str = "fatbands") -> None:
+        """
+        Store the bands, the case.qtl data, the structure and the Fermi energy in the group
+        path of the HDF5 file filename. The case.qtl data covers all atoms, unless only the
+        plotted atoms were kept by loading with dtype.
+
+        Parameters
+        ----------
+        filename   : string, required
+                     Filename of the HDF5 file. It is created if it does not exist.
+        path       : string, optional
+                     Name of the group inside the file.
+        """
+        with open_group(filename, path, "a") as group:
+            self._write_hdf5(group,
+                             atoms=list(self.atoms),
+                             orbitals=[list(map(int, o)) for o in self.orbitals],
+                             colors=self.colors,
+                             weight=self.weight,
+                             eF=self.eF,
+                             structure=self.structure.to_dict())
+            self.qtl_data._write_hdf5(group.create_group("qtl"))
+
+    def _shared_arrays(self):
+        arrays, meta = super()._shared_arrays()
+        qtl = self.qtl_data
+        arrays["qtl_energy"] = qtl.energy
+        for atom, data in qtl._character.items():
+            arrays[f"qtl_atom{atom}"] = data
+        meta.update(atoms=list(self.atoms),
+                    orbitals=[list(map(int, o)) for o in self.orbitals],
+                    colors=self.colors,
+                    weight=self.weight,
+                    eF=self.eF,
+                    structure=self.structure.to_dict(),
+                    qtl=self.qtl,
+                    qtl_orbitals=qtl.orbitals,
+                    Ry2eV=self.Ry2eV)
+        return arrays, meta
+
+    @staticmethod
+    def _from_shared(arrays, meta):
+        qtl = Qtl.__new__(Qtl)
+        qtl.filename, qtl.orbitals = meta["qtl"], meta["qtl_orbitals"]
+        qtl.energy = arrays["qtl_energy"]
+        qtl.nbands, qtl.nkpoints = qtl.energy.shape
+        qtl._character = {int(key[len("qtl_atom"):]): data for key, data in arrays.items() if key.startswith("qtl_atom")}
+        fat_bands = FatBands(meta["atoms"], meta["orbitals"],
+                             colors=meta["colors"],
+                             weight=meta["weight"],
+                             qtl=qtl,
+                             eF=meta["eF"],
+                             struct=Structure.from_dict(meta["structure"]),
+                             eF_shift=meta["eF_shift"],
+                             bands=Bands._from_shared(arrays, meta))
+        fat_bands.Ry2eV = meta["Ry2eV"]
+        return fat_bands
+
+    @staticmethod
+    def from_hdf5(filename: str,
+                  path: str = "fatbands",
+                  atoms: List[int] = None,
+                  orbitals: List[List[int]] = None,
+                  colors: List[List[str]] = None,
+                  energy_window=None):
+        """
+        Load fat bands stored with to_hdf5. Only the orbital character of the requested atoms,
+        and only the bands inside energy_window, are read from the file.
+
+        Parameters
+        ----------
+        filename      : string, required
+                        Filename of the HDF5 file.
+        path          : string, optional
+                        Name of the group inside the file.
+        atoms         : list[int], optional
+                        atoms to plot, see FatBands. Default are the stored ones.
+        orbitals      : list[list[int]], optional
+                        orbitals to plot, see FatBands. Default are the stored ones.
+        colors        : list[list[string]], optional
+                        colors of the orbitals, see FatBands. Default are the stored ones if atoms is not given.
+        energy_window : tuple(float, float), optional
+                        (lower, upper) energy in eV relative to the Fermi energy.
+        """
+        with open_group(filename, path) as group:
+            meta = read_meta(group)
+            if atoms is None:
+                atoms, orbitals = meta["atoms"], meta["orbitals"]
+                colors = meta["colors"] if colors is None else colors
+            assert orbitals is not None, "Please provide the orbitals of the atoms!"
+            bands = Bands._read_hdf5(group, energy_window)
+            window = None if energy_window is None else \
+                [meta["eF"] + (e + meta["eF_shift"]) / Ry2eV for e in energy_window]
+            qtl = Qtl._read_hdf5(group["qtl"], atoms, window)
+        return FatBands(atoms, orbitals,
+                        colors=colors,
+                        weight=meta["weight"],
+                        qtl=qtl,
+                        eF=meta["eF"],
+                        struct=Structure.from_dict(meta["structure"]),
+                        eF_shift=meta["eF_shift"],
+                        bands=bands)
+
     def create_legend(self):
         """
         internal function to build the legend elements for the figure legend.
@@ -367,6 +832,7 @@ class FatBands(Bands):
         return legend_elements
 
 
+@timed("artists:fatband_plot")
 def __fatband_plot(figure, fat_bands, *opt_list, **opt_dict):
     if isinstance(figure, types.ModuleType):
         figure = figure.gca()
@@ -374,31 +840,60 @@ def __fatband_plot(figure, fat_bands, *opt_list, **opt_dict):
     # plot the bands
     __band_plot(figure, fat_bands, *opt_list, **opt_dict)
 
-    qtl_file = open(fat_bands.qtl)
-    qtl = qtl_file.readlines()
-    qtl_file.close()
-    start = [line + 1 for line in range(len(qtl)) if "BAND" in qtl[line]][0]
-    qtl = qtl[start:]
-
     # plot the fatband character
+    scatter_character(figure, fat_bands, fat_bands.qtl_data, fat_bands.kpoints, fat_bands.qtl_energy())
+
+
+def qtl_to_eV(energy: np.ndarray, eF: float, eF_shift: float = 0, Ry2eV: float = Ry2eV) -> np.ndarray:
+    """
+    Convert the energies of a case.qtl to eV relative to the Fermi energy.
+
+    Parameters
+    ----------
+    energy      : np.ndarray, required
+                  energies in Ry.
+    eF          : float, required
+                  Fermi energy in Ry.
+    eF_shift    : float, optional
+                  shift of the Fermi energy in eV.
+    Ry2eV       : float, optional
+                  conversion factor, e.g., the Ry2eV of a FatBands.
+    """
+    # wien2k interal units are Ry switch to eV
+    return (energy - eF) * Ry2eV - eF_shift
+
+
+def scatter_character(figure, fat_bands, qtl: Qtl, kpoints: np.ndarray, E: np.ndarray) -> List:
+    """
+    Scatter the orbital character of every (atom, orbital) of fat_bands, with marker sizes
+    scaled by the weight and the multiplicity of the atom.
+
+    Parameters
+    ----------
+    figure      : matplotlib.axes.Axes, required
+    fat_bands   : FatBands or FatBandsWatcher, required
+                  the atoms, orbitals, colors, weight and structure.
+    qtl         : Qtl, required
+                  the orbital character of the bands to plot.
+    kpoints     : np.ndarray, required
+                  kpath of shape (nkpoints,).
+    E           : np.ndarray, required
+                  energies (eV) of the qtl of shape (nbands, nkpoints).
+
+    Returns
+    -------
+    artists     : list
+                  one scatter per (atom, orbital).
+    """
+    kpoints = np.tile(kpoints, len(E))
+    artists = []
     for (a, at) in enumerate(fat_bands.atoms):
+        # weight factor
+        enh = float(fat_bands.weight * fat_bands.structure.atoms[at - 1][1])
         for o in range(len(fat_bands.orbitals[a])):
-            E, character = [], []
-            for line in qtl:
-                if 'BAND' not in line:
-                    if line.split()[1] == str(at):
-                        # wien2k interal units are Ry switch to eV
-                        E.append((float(line.split()[0]) - fat_bands.eF) * fat_bands.Ry2eV - fat_bands.eF_shift)
-                        # weight factor
-                        enh = float(fat_bands.weight * fat_bands.structure.atoms[at - 1][1])
-                        # qtl overlap
-                        ovlap = (float(line.split()[int(fat_bands.orbitals[a][o]) + 1]))
-                        character.append(enh * ovlap)
-                else:
-                    assert len(fat_bands.kpoints) == len(E), f"Did not parse file correctly! {len(fat_bands.kpoints), len(E)}"
-                    assert len(E) == len(character), "Did not parse file correctly!"
-                    figure.scatter(fat_bands.kpoints, E, character, fat_bands.colors[a][o], rasterized=True)
-                    E, character = [], []
+            character = enh * qtl.character(at, fat_bands.orbitals[a][o])
+            artists.append(figure.scatter(kpoints, E.ravel(), character.ravel(), fat_bands.colors[a][o], rasterized=True))
+    return artists
 
 # fatband plot functions
 plt.style.use([w2kplot_base_style, w2kplot_base_style])
@@ -406,3 +901,84 @@ def fatband_plot(fat_bands,*opt_list, **opt_dict): __fatband_plot(plt, fat_bands
 
 plt.style.use([w2kplot_base_style, w2kplot_base_style])
 mpl.axes.Axes.fatband_plot = lambda self, fat_bands, *opt_list, **opt_dict: __fatband_plot(self, fat_bands, *opt_list, **opt_dict)
+
+
+@timed("artists:fatband_blend_plot")
+def __fatband_blend_plot(figure, fat_bands, lw=1.0, base_color="lightgray", **opt_dict):
+
+    if isinstance(figure, types.ModuleType):
+        figure = figure.gca()
+
+    qtl = fat_bands.qtl_data
+    E = fat_bands.qtl_energy()
+
+    projections = [(at, orb, fat_bands.colors[a][o])
+                   for (a, at) in enumerate(fat_bands.atoms) for (o, orb) in enumerate(fat_bands.orbitals[a])]
+    assert len(projections) <= 4, f"at most four projections can be blended, got {len(projections)}"
+
+    # mix the colors of the projections by their weighted character at every point,
+    # points without character keep the base color
+    rgb = np.zeros(E.shape + (3,))
+    total = np.zeros_like(E)
+    for (at, orb, color) in projections:
+        # weight factor, as in fatband_plot
+        enh = float(fat_bands.weight * fat_bands.structure.atoms[at - 1][1])
+        character = enh * qtl.character(at, orb)
+        rgb += character[:, :, None] * mpl.colors.to_rgb(color)
+        total += character
+    mixed = rgb / np.where(total > 0, total, 1)[:, :, None]
+    alpha = np.clip(total / fat_bands.weight, 0, 1)[:, :, None]
+    rgb = alpha * mixed + (1 - alpha) * mpl.colors.to_rgb(base_color)
+
+    # one segment between every pair of neighbouring kpoints of every band, colored
+    # and sized by the mean of its end points. The weighted character is the marker
+    # area (points^2) of fatband_plot, so the line is as wide as those markers.
+    k = np.broadcast_to(fat_bands.kpoints, E.shape)
+    points = np.stack([k, E], axis=-1)
+    segments = np.stack([points[:, :-1], points[:, 1:]], axis=2).reshape(-1, 2, 2)
+    colors = 0.5 * (rgb[:, :-1] + rgb[:, 1:]).reshape(-1, 3)
+    widths = lw + np.sqrt(0.5 * (total[:, :-1] + total[:, 1:])).ravel()
+
+    figure.add_collection(LineCollection(segments, colors=colors, linewidths=widths, **opt_dict))
+    decorate_band_plot(figure, fat_bands)
+
+# fatband_blend_plot functions
+plt.style.use([w2kplot_base_style, w2kplot_base_style])
+def fatband_blend_plot(fat_bands, lw=1.0, base_color="lightgray", **opt_dict):
+    __fatband_blend_plot(plt, fat_bands, lw, base_color, **opt_dict)
+
+plt.style.use([w2kplot_base_style, w2kplot_base_style])
+mpl.axes.Axes.fatband_blend_plot = lambda self, fat_bands, lw=1.0, base_color="lightgray", **opt_dict: \
+    __fatband_blend_plot(self, fat_bands, lw, base_color, **opt_dict)
+
+
+@timed("artists:fatband_density_plot")
+def __fatband_density_plot(figure, fat_bands, energy_window=(-2, 2), resolution=None, **opt_dict):
+
+    if isinstance(figure, types.ModuleType):
+        figure = figure.gca()
+
+    qtl = fat_bands.qtl_data
+    E = fat_bands.qtl_energy()
+
+    # total character of the selected orbitals
+    weights = np.zeros_like(E)
+    for (a, at) in enumerate(fat_bands.atoms):
+        for orb in fat_bands.orbitals[a]:
+            weights += qtl.character(at, orb)
+
+    image, extent = _density_image(figure, fat_bands.kpoints, E, weights, energy_window, resolution)
+    opt_dict.setdefault("cmap", "Blues")
+    figure.imshow(image, origin="lower", extent=extent, aspect="auto", interpolation="nearest", **opt_dict)
+
+    decorate_band_plot(figure, fat_bands)
+    figure.set_ylim(*energy_window)
+
+# fatband_density_plot functions
+plt.style.use([w2kplot_base_style, w2kplot_base_style])
+def fatband_density_plot(fat_bands, energy_window=(-2, 2), resolution=None, **opt_dict):
+    __fatband_density_plot(plt, fat_bands, energy_window, resolution, **opt_dict)
+
+plt.style.use([w2kplot_base_style, w2kplot_base_style])
+mpl.axes.Axes.fatband_density_plot = lambda self, fat_bands, energy_window=(-2, 2), resolution=None, **opt_dict: \
+    __fatband_density_plot(self, fat_bands, energy_window, resolution, **opt_dict)
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+##########################################################################
+#
+# w2kplot: a thin Python wrapper around matplotlib
+#
+# Copyright (C) 2022 Harrison LaBollita
+# Authors: H. LaBollita
+#
+# w2kplot is free software licensed under the terms of the MIT license.
+#
+##########################################################################
+
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+from typing import List, Dict, Iterator, Tuple
+
+import matplotlib
+
+# figures of the current worker (process or thread), keyed by figsize, reused from case to case
+_templates = threading.local()
+
+default_spec = {"plot": "bands",      # bands, fatbands or dos
+                "atoms": None,        # fatbands only, see FatBands
+                "orbitals": None,     # fatbands only, see FatBands
+                "colors": None,       # fatbands only, see FatBands
+                "weight": 50,         # fatbands only, see FatBands
+                "color": "k",
+                "lw": 1.5,
+                "ymin": -4,
+                "ymax": 4,
+                "figsize": (4, 3),
+                "format": "png",
+                "dpi": 300,
+                "outdir": None,       # default is the case directory
+                }
+
+
+def _init_worker() -> None:
+    """
+    Internal function run once in each worker process.
+    """
+    matplotlib.use("Agg")
+
+
+def _template(figsize):
+    """
+    Internal function to get a cleared figure of the current worker. The figures are
+    not managed by pyplot, so that different threads can draw at the same time.
+    """
+    from matplotlib.figure import Figure
+    if not hasattr(_templates, "figures"): _templates.figures = {}
+    figures = _templates.figures
+    figsize = tuple(figsize)
+    if figsize not in figures:
+        fig = Figure(figsize=figsize)
+        figures[figsize] = fig, fig.add_subplot()
+    fig, ax = figures[figsize]
+    for legend in fig.legends: legend.remove()
+    ax.cla()
+    return fig, ax
+
+
+def draw_case(case, spec: Dict):
+    """
+    Draw a case according to spec on a figure reused by the current worker.
+
+    Parameters
+    ----------
+    case        : Case, required
+                  The WIEN2k case.
+    spec        : dict, required
+                  plot specification, see default_spec.
+
+    Returns
+    -------
+    fig         : matplotlib.figure.Figure
+                  the figure, valid until the next call in the same worker.
+    """
+    spec = dict(default_spec, **spec)
+    fig, ax = _template(spec["figsize"])
+
+    if spec["plot"] == "bands":
+        ax.band_plot(case.bands, color=spec["color"], lw=spec["lw"])
+        ax.set_ylim(spec["ymin"], spec["ymax"])
+    elif spec["plot"] == "fatbands":
+        fat_bands = case.fatbands(spec["atoms"], spec["orbitals"], colors=spec["colors"], weight=spec["weight"])
+        ax.fatband_plot(fat_bands, color=spec["color"], lw=spec["lw"])
+        ax.set_ylim(spec["ymin"], spec["ymax"])
+        fig.legend(handles=fat_bands.create_legend(), ncol=3, loc="upper center")
+    elif spec["plot"] == "dos":
+        from . import dos  # registers Axes.dos_plot
+        ext, density = sorted(case.dos.items())[0]
+        ax.dos_plot(density[:, 0], density[:, 1], color=spec["color"], lw=spec["lw"])
+        ax.set_xlim(spec["ymin"], spec["ymax"])
+    else:
+        raise ValueError(f"unknown plot {spec['plot']}, must be bands, fatbands or dos")
+    return fig
+
+
+def render_case(directory: str, spec: Dict) -> str:
+    """
+    Render a single case directory according to spec.
+
+    Parameters
+    ----------
+    directory   : string, required
+                  The WIEN2k case directory.
+    spec        : dict, required
+                  plot specification, see default_spec.
+
+    Returns
+    -------
+    output      : string
+                  filename of the rendered figure.
+    """
+    # imported here so that the w2kplot styles and Axes methods are registered after the backend is set
+    from .case import Case
+    from .export import savefig
+
+    spec = dict(default_spec, **spec)
+    case = Case(directory=directory)
+    fig = draw_case(case, spec)
+
+    outdir = spec["outdir"] or directory
+    output = os.path.join(outdir, f"{case.case}_{spec['plot']}.{spec['format']}")
+    savefig(fig, output, dpi=spec["dpi"])
+    return output
+
+
+def _render(directory: str, spec: Dict, memory: bool = None) -> Tuple:
+    """
+    Internal function that renders one case and never raises. With memory, the case
+    is profiled and the records and start of the profile are returned as well.
+    """
+    from .profiling import profile
+
+    start = time.perf_counter()
+    with (nullcontext() if memory is None else profile(memory)) as p:
+        try:
+            output, error = render_case(directory, spec), None
+        except Exception as e:
+            output, error = None, f"{type(e).__name__}: {e}"
+    result = (directory, output, time.perf_counter() - start, error)
+    return result if p is None else result + (p.records, p.start)
+
+
+def batch_render(directories: List[str],
+                 spec: Dict,
+                 workers: int = None,
+                 profile=None) -> Iterator[Tuple[str, str, float, str]]:
+    """
+    Render many case directories on a pool of worker processes using the Agg backend.
+    A failing case does not abort the others.
+
+    Parameters
+    ----------
+    directories : list[string], required
+                  The WIEN2k case directories.
+    spec        : dict, required
+                  plot specification, see default_spec.
+    workers     : int, optional
+                  number of worker processes. Default is the number of CPUs.
+    profile     : w2kplot.profiling.Profile, optional
+                  the workers profile every case and their records are merged into profile,
+                  e.g., the Profile of a with w2kplot.profile() block.
+
+    Returns
+    -------
+    results     : iterator of (directory, output, seconds, error)
+                  yielded as the cases finish; error is None on success.
+    """
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        memory = None if profile is None else profile.memory
+        futures = [pool.submit(_render, directory, spec, memory) for directory in directories]
+        for future in as_completed(futures):
+            result = future.result()
+            if profile is not None: profile.merge(*result[4:])
+            yield result[:4]
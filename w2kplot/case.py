@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+##########################################################################
+#
+# w2kplot: a thin Python wrapper around matplotlib
+#
+# Copyright (C) 2022 Harrison LaBollita
+# Authors: H. LaBollita
+#
+# w2kplot is free software licensed under the terms of the MIT license.
+#
+##########################################################################
+
+import os
+import re
+import threading
+from typing import TYPE_CHECKING, List, Dict
+
+from .bands import Bands, FatBands
+from .structure import Structure
+from .qtl import Qtl
+from .charge import ChargeDensity
+from .profiling import stage, add_bytes
+from .utils import load_concurrently, open_file, strip_compression
+
+if TYPE_CHECKING:
+    from .dos import DensityOfStates
+
+
+class Case(object):
+    """this is a wien2k case class. The case directory is scanned once and every
+       file is parsed lazily, at most once, and shared between the data objects.
+    """
+
+    def __init__(self,
+                 case: str = None,
+                 directory: str = ".",
+                 eF_shift: float = 0,
+                 dtype=None) -> None:
+        """
+        Initialize the Case object.
+
+        Parameters
+        ----------
+        case       : string, optional
+                     Name of the case, i.e., the prefix of the case.* files. If not given,
+                     the name of the directory is used if it matches, otherwise the prefix of
+                     the case.struct file.
+        directory  : string, optional
+                     The WIEN2k case directory. Default is the current directory.
+        eF_shift   : float, optional
+                     Optional parameter to shift the Fermi energy. Units are eV.
+        dtype      : numpy dtype, optional
+                     dtype of all parsed arrays, e.g., np.float32 or np.float16 (energies are kept
+                     in at least single precision). Default is float64. The memory used is nbytes.
+        """
+        self.directory = directory
+        self.eF_shift = eF_shift
+        self.dtype = dtype
+        self._cache = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+        try:
+            with stage("discovery"):
+                names = sorted(entry.name for entry in os.scandir(directory) if entry.is_file())
+        except BaseException:
+            raise FileNotFoundError(f"Could not find the case directory {directory}.")
+
+        if case is None:
+            stem = os.path.basename(os.path.abspath(directory))
+            structs = [name[:-len(".struct")] for name in map(strip_compression, names) if name.endswith(".struct")]
+            if any(name.startswith(stem + ".") for name in names):
+                case = stem
+            elif structs:
+                case = structs[0]
+            else:
+                raise FileNotFoundError(
+                    f"Could not find a case.struct file in {directory}.\nPlease provide the name of the case.")
+        self.case = case
+
+        # map each extension, e.g., spaghetti_ene, to its file. Compressed files are
+        # found under the same extension, but the uncompressed file is preferred.
+        self.files = {}
+        for name in names:
+            if name.startswith(case + "."):
+                self.files.setdefault(strip_compression(name)[len(case) + 1:], os.path.join(directory, name))
+
+    def __contains__(self, ext: str) -> bool: return ext in self.files
+
+    def file(self, ext: str) -> str:
+        """
+        Filename of case.ext found in the case directory.
+
+        Parameters
+        ----------
+        ext        : string, required
+                     extension of the file, e.g., spaghetti_ene.
+        """
+        try:
+            return self.files[ext]
+        except KeyError:
+            raise FileNotFoundError(
+                f"Could not find a case.{ext} file in {self.directory}.\nPlease provide a case.{ext} file")
+
+    def _memo(self, key, load):
+        """
+        Internal function to load key once and share it afterwards. Threads asking
+        for the same key wait for the first one to load it.
+        """
+        if key in self._cache: return self._cache[key]
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in self._cache:
+                self._cache[key] = load()
+        return self._cache[key]
+
+    @property
+    def nbytes(self) -> int:
+        """
+        memory used by the arrays of the files parsed so far, in bytes.
+        """
+        def size(value):
+            if isinstance(value, dict): return sum(size(v) for v in value.values())
+            return getattr(value, "nbytes", 0)
+        return sum(size(value) for value in self._cache.values())
+
+    # parsed files
+    @property
+    def klist_band(self):
+        """
+        indices and labels of the high symmetry points from case.klist_band.
+        """
+        return self._memo("klist_band", lambda: Bands._read_klist_band(self.file("klist_band")))
+
+    def _bands(self, ext: str) -> Bands:
+        def load():
+            kpoints, Ek = Bands._read_spaghetti(self.file(ext))
+            indices, labels = self.klist_band
+            return Bands.from_data(kpoints, Ek, [kpoints[i] for i in indices], labels,
+                                   eF_shift=self.eF_shift,
+                                   spaghetti=self.file(ext),
+                                   klist_band=self.file("klist_band"),
+                                   dtype=self.dtype)
+        return self._memo(ext, load)
+
+    @property
+    def bands(self) -> Bands: return self._bands("spaghetti_ene")
+
+    @property
+    def up(self) -> Bands: return self._bands("spaghettiup_ene")
+
+    @property
+    def down(self) -> Bands: return self._bands("spaghettidn_ene")
+
+    @property
+    def structure(self) -> Structure:
+        return self._memo("struct", lambda: Structure(self.file("struct")))
+
+    @property
+    def scf(self) -> List[str]:
+        """
+        lines of the case.scf file.
+        """
+        def load():
+            with stage("parse:scf"):
+                add_bytes(self.file("scf"))
+                f = open_file(self.file("scf"))
+                contents = f.readlines()
+                f.close()
+            return contents
+        return self._memo("scf", load)
+
+    @property
+    def eF(self) -> float:
+        """
+        the Fermi energy (Ry) from the last :FER line of case.scf.
+        """
+        return self._memo("eF", lambda: float([line for line in self.scf if ":FER" in line][-1].split()[-1].strip()))
+
+    def _qtl(self, ext: str) -> Qtl: return self._memo(ext, lambda: Qtl(self.file(ext), self.dtype))
+
+    @property
+    def qtl(self) -> Qtl: return self._qtl("qtl")
+
+    @property
+    def dos(self) -> Dict[str, "DensityOfStates"]:
+        """
+        all case.dosXev(up/dn) files keyed by their extension.
+        """
+        from .dos import DensityOfStates
+        return self._memo("dos", lambda: {ext: DensityOfStates(path, dtype=self.dtype) for ext, path in self.files.items()
+                                          if re.fullmatch(r"dos\d+ev(up|dn)?", ext)})
+
+    @property
+    def rho(self) -> ChargeDensity:
+        return self._memo("rho", lambda: ChargeDensity(rho=self.file("rho"), dtype=self.dtype))
+
+    def fatbands(self,
+                 atoms: List[int],
+                 orbitals: List[List[int]],
+                 spin: str = None,
+                 **kwargs) -> FatBands:
+        """
+        Build a FatBands object from the shared bands, qtl, structure and Fermi energy.
+
+        Parameters
+        ----------
+        atoms       : list[int], required
+                      see FatBands.
+        orbitals    : list[list[int]], required
+                      see FatBands.
+        spin        : string, optional
+                      'up' or 'dn' to use case.spaghettiup/dn_ene and case.qtlup/dn.
+        kwargs      : optional
+                      passed to FatBands, e.g., colors and weight.
+        """
+        assert spin in [None, "up", "dn"], f"spin = {spin} must be None, 'up' or 'dn'"
+        spin = spin or ""
+        # the files that are not parsed yet are read concurrently
+        data = load_concurrently({"bands": lambda: self._bands("spaghetti" + spin + "_ene"),
+                                  "qtl": lambda: self._qtl("qtl" + spin),
+                                  "structure": lambda: self.structure,
+                                  "eF": lambda: kwargs["eF"] if "eF" in kwargs else self.eF})
+        kwargs["eF"] = data["eF"]
+        return FatBands(atoms, orbitals,
+                        qtl=data["qtl"],
+                        struct=data["structure"],
+                        eF_shift=self.eF_shift,
+                        bands=data["bands"],
+                        **kwargs)
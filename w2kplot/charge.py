@@ -11,29 +11,60 @@
 #
 ##########################################################################
 
-import glob
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib as mpl
-
-
-class ChargeDensity(object):
-    def __init__(self, case=None, rho=None, transform=lambda x: x):
-
-        rho = case + '.rho' if case else rho
+import types
+
+from . import w2kplot_base_style
+from .utils import open_file, find_files, case_file, compact_array
+from .profiling import timed
+from .hdf5 import open_group, write_dataset
+from .shared import Shareable
+
+
+class ChargeDensity(Shareable):
+    __slots__ = ("rho", "transform", "dtype")
+
+    def __init__(self, case=None, rho=None, transform=lambda x: x, dtype=None):
+        """
+        Initialize the ChargeDensity object.
+
+        Parameters
+        ----------
+        case       : string, optional
+                     name of the case, the case.rho file is read.
+        rho        : string or np.ndarray, optional
+                     Filename of the case.rho file, or the charge density itself.
+        transform  : callable, optional
+                     applied to the charge density after reading it, e.g., np.log.
+        dtype      : numpy dtype, optional
+                     dtype of the grid, e.g., np.float32 or np.float16. Default is float64.
+                     The memory used is nbytes.
+        """
+        rho = case_file(case, '.rho') if case else rho
 
         self.rho = rho
         assert callable(transform), "The transform function must be callable!"
 
         self.transform = transform
+        self.dtype = dtype
         if self.rho is None:
             try:
-                self.rho = glob.glob("*.rho")[0]
+                self.rho = find_files("*.rho")[0]
             except Exception:
                 raise FileNotFoundError(
                     "Could not find a case.rho file in this repository.\nPlease provide a case.rho file")
         if isinstance(self.rho, str):
             self.rho = self.get_charge_density()
+        self.rho = compact_array(self.rho, dtype)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        memory used by the grid, in bytes.
+        """
+        return self.rho.nbytes
 
     def __sub__(self, other_rho):
         assert self.rho.shape == other_rho.rho.shape
@@ -43,8 +74,39 @@ class ChargeDensity(object):
         assert self.rho.shape == other_rho.rho.shape
         return ChargeDensity(rho=self.rho + other_rho.rho)
 
+    def to_hdf5(self, filename: str, path: str = "rho") -> None:
+        """
+        Store the (transformed) charge density in the group path of the HDF5 file filename.
+        """
+        with open_group(filename, path, "a") as group:
+            write_dataset(group, "rho", self.rho)
+
+    def _shared_arrays(self): return {"rho": self.rho}, {}
+
+    @staticmethod
+    def _from_shared(arrays, meta): return ChargeDensity(rho=arrays["rho"])
+
+    @staticmethod
+    def from_hdf5(filename: str, path: str = "rho", region=None):
+        """
+        Load a charge density stored with to_hdf5.
+
+        Parameters
+        ----------
+        filename   : string, required
+                     Filename of the HDF5 file.
+        path       : string, optional
+                     Name of the group inside the file.
+        region     : tuple(slice, slice), optional
+                     read only this part of the grid.
+        """
+        with open_group(filename, path) as group:
+            rho = group["rho"][region if region is not None else ()]
+        return ChargeDensity(rho=rho)
+
+    @timed("parse:rho", filename=lambda self: self.rho)
     def get_charge_density(self):
-        f = open(self.rho)
+        f = open_file(self.rho)
         data = f.readlines()
         f.close()
         Nx, Ny = list(map(int, data[0].split()[:2]))
@@ -59,6 +121,7 @@ def charge_2d_plot(charge_density, *opt_list, **opt_dict):
     __charge_2d_plot(plt, charge_density, *opt_list, **opt_dict)
 
 
+@timed("artists:charge_2d_plot")
 def __charge_2d_plot(figure, charge_density, *opt_list, **opt_dict):
     if isinstance(figure, types.ModuleType):
         figure = figure.gca()
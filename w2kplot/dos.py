@@ -22,12 +22,18 @@ from typing import Union, List, Dict
 from scipy import integrate
 
 from . import w2kplot_base_style
+from .utils import open_file, compact_array
+from .profiling import stage, add_bytes, timed
+from .hdf5 import open_group, write_dataset, write_meta, read_meta
+from .shared import Shareable
 
 # DensityOfStates object
 
 
-class DensityOfStates:
-    def __init__(self, filename) -> None:
+class DensityOfStates(Shareable):
+    __slots__ = ("_filename", "_data")
+
+    def __init__(self, filename, columns=None, dtype=None) -> None:
         """
         Initialize the DensityOfStates object.
 
@@ -35,13 +41,81 @@ class DensityOfStates:
         ----------
         filename    : string, required
                      A Wien2k formatted dosXev(X/up/dn) or dossumev(X/up/dn)
+        columns     : list[int], optional
+                     keep only these columns of the file; the energy (column 0) is always kept
+                     and the kept columns are renumbered in order. Default keeps all columns.
+        dtype       : numpy dtype, optional
+                     e.g., np.float32. The table holds the energies, so float16 is promoted to float32.
+                     Default is float64. The memory used is nbytes.
         """
         self._filename = filename
+        usecols = None if columns is None else sorted(set([0] + list(columns)))
         try:
-            self._data = np.loadtxt(filename)
+            with stage("parse:dos"), open_file(filename) as f:
+                add_bytes(filename)
+                self._data = compact_array(np.loadtxt(f, usecols=usecols, ndmin=2), dtype, energy=True)
         except BaseException:
             raise FileNotFoundError(f"Could not find {filename}.")
 
+    @property
+    def nbytes(self) -> int:
+        """
+        memory used by the table, in bytes.
+        """
+        return self._data.nbytes
+
+    def to_hdf5(self, filename: str, path: str = "dos") -> None:
+        """
+        Store the density of states in the group path of the HDF5 file filename.
+
+        Parameters
+        ----------
+        filename   : string, required
+                     Filename of the HDF5 file. It is created if it does not exist.
+        path       : string, optional
+                     Name of the group inside the file.
+        """
+        with open_group(filename, path, "a") as group:
+            # one chunk per column, such that a single column can be read on its own
+            write_dataset(group, "data", self._data, chunks=(4096, 1))
+            write_meta(group, filename=self._filename)
+
+    def _shared_arrays(self): return {"data": self._data}, {"filename": self._filename}
+
+    @staticmethod
+    def _from_shared(arrays, meta):
+        dos = DensityOfStates.__new__(DensityOfStates)
+        dos._filename, dos._data = meta["filename"], arrays["data"]
+        return dos
+
+    @staticmethod
+    def from_hdf5(filename: str, path: str = "dos", columns=None, energy_window=None):
+        """
+        Load a density of states stored with to_hdf5.
+
+        Parameters
+        ----------
+        filename      : string, required
+                        Filename of the HDF5 file.
+        path          : string, optional
+                        Name of the group inside the file.
+        columns       : list[int], optional
+                        read only these columns; the energy (column 0) is always read.
+        energy_window : tuple(float, float), optional
+                        read only the energies inside (lower, upper).
+        """
+        with open_group(filename, path) as group:
+            data = group["data"]
+            rows = slice(None)
+            if energy_window is not None:
+                inside = np.where((data[:, 0] >= energy_window[0]) & (data[:, 0] <= energy_window[1]))[0]
+                rows = slice(int(inside[0]), int(inside[-1]) + 1) if len(inside) else slice(0, 0)
+            cols = slice(None) if columns is None else sorted(set([0] + list(columns)))
+            dos = DensityOfStates.__new__(DensityOfStates)
+            dos._filename = read_meta(group)["filename"]
+            dos._data = data[rows, cols]
+        return dos
+
     # dunder to get the underlying data;
     def __getitem__(self, x): return self._data.__getitem__(x)
 
@@ -65,6 +139,7 @@ styleguides_str2int = {'line': 0,  # standard line plot
                        }
 
 
+@timed("artists:dos_plot")
 def __dos_plot(figure, x, y, dos_style, *opt_list, **opt_dict):
 
     if isinstance(figure, types.ModuleType):
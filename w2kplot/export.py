@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+##########################################################################
+#
+# w2kplot: a thin Python wrapper around matplotlib
+#
+# Copyright (C) 2022 Harrison LaBollita
+# Authors: H. LaBollita
+#
+# w2kplot is free software licensed under the terms of the MIT license.
+#
+##########################################################################
+
+"""
+export size policy for vector figures (pdf, svg, eps): the data artists with many
+vertices, e.g., the fat band markers of a large case or the bands of a supercell,
+are rasterized at the dpi of the saved figure and the lines are simplified, while
+the axes, labels, high symmetry lines and the Fermi level stay vector.
+"""
+
+import os
+import numpy as np
+from contextlib import contextmanager
+from matplotlib.collections import Collection
+from matplotlib.lines import Line2D
+from matplotlib.path import Path
+from matplotlib.transforms import Affine2D
+from typing import List
+
+vector_formats = ["pdf", "svg", "svgz", "eps", "ps"]
+
+
+def vertex_count(artist) -> int:
+    """
+    Number of vertices drawn by a line or a collection, e.g., the number of markers
+    times the vertices of the marker for a scatter.
+    """
+    if isinstance(artist, Line2D):
+        return len(artist.get_xydata())
+    if isinstance(artist, Collection):
+        paths = artist.get_paths()
+        if len(paths) == 1 and len(artist.get_offsets()) > 1:
+            return len(artist.get_offsets()) * len(paths[0].vertices)
+        return sum(len(p.vertices) for p in paths)
+    return 0
+
+
+def _data_artists(ax) -> List:
+    # lines and collections in data coordinates; axvline, axhline, ... use the
+    # axis transforms and are never rasterized
+    def in_data(artist):
+        if isinstance(artist, Collection) and artist.get_transform().contains_branch(ax.transData) is False:
+            # markers of a scatter are placed by their offsets
+            return artist.get_offset_transform().contains_branch(ax.transData)
+        return artist.get_transform().contains_branch(ax.transData)
+    return [artist for artist in list(ax.lines) + list(ax.collections) if in_data(artist)]
+
+
+def heavy_artists(figure, max_vertices: int = 10000, max_axes_vertices: int = 500000) -> List:
+    """
+    The data artists to rasterize: every artist with more than max_vertices vertices, and
+    all the data artists of an axes whose data artists have more than max_axes_vertices
+    vertices in total, e.g., the thousands of bands of a supercell drawn by band_plot.
+
+    Parameters
+    ----------
+    figure            : matplotlib.figure.Figure, required
+    max_vertices      : int, optional
+                        vertex count above which a single artist is rasterized.
+    max_axes_vertices : int, optional
+                        vertex count of all data artists of an axes above which they are rasterized.
+    """
+    heavy = []
+    for ax in figure.axes:
+        artists = _data_artists(ax)
+        counts = [vertex_count(artist) for artist in artists]
+        if sum(counts) > max_axes_vertices:
+            heavy.extend(artists)
+        else:
+            heavy.extend(artist for (artist, n) in zip(artists, counts) if n > max_vertices)
+    return heavy
+
+
+def _simplify_lines(figure, tolerance: float) -> List:
+    """
+    Internal function replacing the data of the long data lines of figure by their simplification,
+    which deviates by at most tolerance points (the unit of the vector formats) from the data.
+
+    Returns
+    -------
+    simplified : list
+                 (line, xdata, ydata) with the original data of every simplified line.
+    """
+    simplified = []
+    if tolerance <= 0: return simplified
+    for ax in figure.axes:
+        # data coordinates -> points of the saved figure
+        transform = ax.transData + Affine2D().scale(72 / figure.dpi)
+        for line in _data_artists(ax):
+            if not isinstance(line, Line2D) or len(line.get_xydata()) < 128: continue
+            # markers and steps are drawn at every data point
+            if line.get_marker() not in ["None", "", None] or line.get_drawstyle() != "default": continue
+            path = Path(transform.transform(line.get_xydata()))
+            path.simplify_threshold = tolerance
+            cleaned = path.cleaned(simplify=True)
+            # lines broken by nans are kept as they are
+            if np.count_nonzero(cleaned.codes == Path.MOVETO) > 1: continue
+            x, y = transform.inverted().transform(cleaned.vertices[cleaned.codes != Path.STOP]).T
+            simplified.append((line, line.get_xdata(orig=True), line.get_ydata(orig=True)))
+            line.set_data(x, y)
+    return simplified
+
+
+@contextmanager
+def export_policy(figure, max_vertices: int = 10000, max_axes_vertices: int = 500000, tolerance: float = 0.5):
+    """
+    Apply the export size policy to figure inside the with block. The rasterized
+    flags and the data of the simplified lines are restored afterwards. Only the
+    artists of figure are changed, never the global matplotlib settings, so that
+    figures can be saved from several threads at once.
+
+        with export_policy(fig):
+            fig.savefig('bands.pdf', dpi=300)
+
+    Parameters
+    ----------
+    figure            : matplotlib.figure.Figure, required
+    max_vertices      : int, optional
+                        vertex count above which a single artist is rasterized, see heavy_artists.
+    max_axes_vertices : int, optional
+                        vertex count of an axes above which its data artists are rasterized.
+    tolerance         : float, optional
+                        maximum deviation, in points, of a simplified line from the data.
+                        Lines with markers or steps are not simplified.
+    """
+    heavy = heavy_artists(figure, max_vertices, max_axes_vertices)
+    rasterized = [artist.get_rasterized() for artist in heavy]
+    for artist in heavy: artist.set_rasterized(True)
+    # the data itself is simplified, matplotlib rebuilds the paths of long lines when drawing
+    simplified = _simplify_lines(figure, tolerance)
+    try:
+        yield heavy
+    finally:
+        for (artist, r) in zip(heavy, rasterized): artist.set_rasterized(r)
+        for (line, x, y) in simplified: line.set_data(x, y)
+
+
+def savefig(figure, filename, dpi: int = 300, max_vertices: int = 10000, max_axes_vertices: int = 500000,
+            tolerance: float = 0.5, **kwargs) -> None:
+    """
+    Save figure and apply the export size policy when the format is a vector format.
+
+    Parameters
+    ----------
+    figure        : matplotlib.figure.Figure or matplotlib.pyplot, required
+    filename      : string or file object, required
+    dpi           : int, optional
+                    resolution of the saved figure and of the rasterized artists.
+    max_vertices, max_axes_vertices, tolerance : optional
+                    see export_policy.
+    kwargs        : optional
+                    passed to matplotlib savefig, e.g., format.
+    """
+    if not hasattr(figure, "axes") or callable(figure.axes):
+        figure = figure.gcf()
+    fmt = kwargs.get("format")
+    if fmt is None and isinstance(filename, (str, os.PathLike)):
+        fmt = os.path.splitext(str(filename))[1][1:].lower()
+    if fmt not in vector_formats:
+        figure.savefig(filename, dpi=dpi, **kwargs)
+        return
+    with export_policy(figure, max_vertices, max_axes_vertices, tolerance):
+        figure.savefig(filename, dpi=dpi, **kwargs)
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+
+##########################################################################
+#
+# w2kplot: a thin Python wrapper around matplotlib
+#
+# Copyright (C) 2022 Harrison LaBollita
+# Authors: H. LaBollita
+#
+# w2kplot is free software licensed under the terms of the MIT license.
+#
+##########################################################################
+
+import math
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import Tuple
+
+import matplotlib
+
+from .shared import Shareable
+
+# data of the current worker process, set once by _init_worker
+_worker = {}
+
+
+class _Panels(Shareable):
+    """the data shared by all panels of a fat band grid: the base bands as
+       line segments, the qtl energies and the tiled kpoints, computed once.
+       The worker processes attach them, together with the fat bands, from
+       a single shared memory block.
+    """
+
+    def __init__(self, fat_bands, lw: float = 1.0, color: str = "k") -> None:
+        self.fat_bands = fat_bands
+        self.lw, self.color = lw, color
+
+        # the base bands of every panel
+        k = np.broadcast_to(fat_bands.kpoints, fat_bands.Ek.shape)
+        self.segments = np.stack([k, fat_bands.Ek - fat_bands.eF_shift], axis=-1)
+
+        E = fat_bands.qtl_energy()
+        self.E = E.ravel()
+        self.kpoints = np.tile(fat_bands.kpoints, len(E))
+
+    @property
+    def projections(self):
+        fat_bands = self.fat_bands
+        return [(a, o) for a in range(len(fat_bands.atoms)) for o in range(len(fat_bands.orbitals[a]))]
+
+    def _shared_arrays(self):
+        arrays, meta = self.fat_bands._shared_arrays()
+        arrays.update(panel_segments=self.segments, panel_E=self.E, panel_kpoints=self.kpoints)
+        meta.update(panel_lw=self.lw, panel_color=self.color)
+        return arrays, meta
+
+    @staticmethod
+    def _from_shared(arrays, meta):
+        from .bands import FatBands
+        panels = _Panels.__new__(_Panels)
+        panels.fat_bands = FatBands._from_shared(arrays, meta)
+        panels.lw, panels.color = meta["panel_lw"], meta["panel_color"]
+        panels.segments, panels.E, panels.kpoints = arrays["panel_segments"], arrays["panel_E"], arrays["panel_kpoints"]
+        return panels
+
+    def draw(self, ax, index: int) -> None:
+        """
+        Draw the panel of the index-th (atom, orbital) projection on ax.
+        """
+        from matplotlib.collections import LineCollection
+        from .bands import decorate_band_plot
+
+        fat_bands = self.fat_bands
+        a, o = self.projections[index]
+        at, orb = fat_bands.atoms[a], fat_bands.orbitals[a][o]
+        enh = float(fat_bands.weight * fat_bands.structure.atoms[at - 1][1])
+
+        ax.add_collection(LineCollection(self.segments, colors=self.color, linewidths=self.lw))
+        ax.scatter(self.kpoints, self.E, enh * fat_bands.qtl_data.character(at, orb).ravel(),
+                   fat_bands.colors[a][o], rasterized=True)
+        decorate_band_plot(ax, fat_bands)
+        label = fat_bands._get_orbital_labels(at, [orb])[0]
+        ax.set_title(fat_bands.structure[at - 1][0] + "-" + label)
+
+
+def _shape(npanels: int, ncols: int = None) -> Tuple[int, int]:
+    ncols = ncols or math.ceil(math.sqrt(npanels))
+    return math.ceil(npanels / ncols), ncols
+
+
+def fatband_grid(fat_bands,
+                 ncols: int = None,
+                 panel_size: Tuple[float, float] = (3, 3),
+                 ylim: Tuple[float, float] = (-2, 2),
+                 lw: float = 1.0,
+                 color: str = "k"):
+    """
+    Plot a grid of fat band panels, one for every (atom, orbital) pair of fat_bands.
+    The case.qtl is parsed once by fat_bands and the base bands are prepared once for
+    all panels.
+
+        dft = FatBands(atoms=[1, 2], orbitals=[[2, 3, 4], [2, 3, 4]])
+        fig, axes = fatband_grid(dft, ncols=3)
+
+    Parameters
+    ----------
+    fat_bands  : FatBands, required
+                 the atoms, orbitals, colors and weight of the panels.
+    ncols      : int, optional
+                 number of columns. Default gives a square grid.
+    panel_size : tuple(float, float), optional
+                 width and height of a single panel in inches.
+    ylim       : tuple(float, float), optional
+                 energy window of the panels.
+    lw         : float, optional
+                 line width of the base bands.
+    color      : string, optional
+                 color of the base bands.
+
+    Returns
+    -------
+    fig        : matplotlib.figure.Figure
+    axes       : list[matplotlib.axes.Axes]
+                 one axes per panel.
+    """
+    import matplotlib.pyplot as plt
+
+    panels = _Panels(fat_bands, lw, color)
+    nrows, ncols = _shape(len(panels.projections), ncols)
+    fig, axes = plt.subplots(nrows, ncols, figsize=(ncols * panel_size[0], nrows * panel_size[1]),
+                             squeeze=False, sharex=True, sharey=True)
+    axes = list(axes.ravel())
+    for ax in axes[len(panels.projections):]: ax.remove()
+    axes = axes[:len(panels.projections)]
+    for (index, ax) in enumerate(axes):
+        panels.draw(ax, index)
+        ax.set_ylim(*ylim)
+    return fig, axes
+
+
+def _init_worker(handle, panel_size, ylim, dpi) -> None:
+    """
+    Internal function run once in each worker process, which attaches the panels
+    published in shared memory.
+    """
+    matplotlib.use("Agg")
+    from . import bands  # registers the w2kplot styles
+    _worker.update(panels=handle.attach(), panel_size=panel_size, ylim=ylim, dpi=dpi)
+
+
+def _render_panel(index: int) -> np.ndarray:
+    """
+    Internal function to render a single panel in a worker process.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=_worker["panel_size"], dpi=_worker["dpi"])
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    _worker["panels"].draw(ax, index)
+    ax.set_ylim(*_worker["ylim"])
+    fig.tight_layout()
+    canvas.draw()
+    return np.asarray(canvas.buffer_rgba()).copy()
+
+
+def render_fatband_grid(fat_bands,
+                        filename: str,
+                        ncols: int = None,
+                        panel_size: Tuple[float, float] = (3, 3),
+                        ylim: Tuple[float, float] = (-2, 2),
+                        dpi: int = 150,
+                        workers: int = None,
+                        lw: float = 1.0,
+                        color: str = "k") -> str:
+    """
+    Render the grid of fatband_grid to filename. With workers, the panels are drawn in
+    parallel by Agg worker processes, which attach the parsed data from shared memory
+    instead of receiving a copy, and are assembled into a single raster image.
+
+    Parameters
+    ----------
+    fat_bands  : FatBands, required
+                 the atoms, orbitals, colors and weight of the panels.
+    filename   : string, required
+                 output file. With workers it must be a raster format, e.g., png.
+    ncols, panel_size, ylim, lw, color : optional
+                 same as fatband_grid.
+    dpi        : int, optional
+                 resolution of the output.
+    workers    : int, optional
+                 number of worker processes. Default draws a single figure in this process.
+
+    Returns
+    -------
+    filename   : string
+    """
+    if not workers or workers == 1:
+        fig, axes = fatband_grid(fat_bands, ncols, panel_size, ylim, lw, color)
+        fig.tight_layout()
+        fig.savefig(filename, dpi=dpi)
+        import matplotlib.pyplot as plt
+        plt.close(fig)
+        return filename
+
+    npanels = sum(len(orbs) for orbs in fat_bands.orbitals)
+    nrows, ncols = _shape(npanels, ncols)
+    with _Panels(fat_bands, lw, color).to_shared() as shared:
+        with ProcessPoolExecutor(max_workers=min(workers, npanels), initializer=_init_worker,
+                                 initargs=(shared.handle, panel_size, ylim, dpi)) as pool:
+            images = list(pool.map(_render_panel, range(npanels)))
+
+    # empty slots of the last row are white
+    blank = np.full_like(images[0], 255)
+    images += [blank] * (nrows * ncols - npanels)
+    grid = np.concatenate([np.concatenate(images[r * ncols:(r + 1) * ncols], axis=1) for r in range(nrows)], axis=0)
+
+    import matplotlib.image
+    matplotlib.image.imsave(filename, grid, dpi=dpi)
+    return filename
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+##########################################################################
+#
+# w2kplot: a thin Python wrapper around matplotlib
+#
+# Copyright (C) 2022 Harrison LaBollita
+# Authors: H. LaBollita
+#
+# w2kplot is free software licensed under the terms of the MIT license.
+#
+##########################################################################
+
+"""
+helpers to store the parsed w2kplot data objects in chunked, compressed HDF5 files.
+Every object is stored in its own group; arrays are datasets and the metadata
+(Fermi energy, labels, structure, ...) is a JSON string in the attribute "meta".
+"""
+
+import json
+import numpy as np
+from contextlib import contextmanager
+from typing import Tuple
+
+
+def _h5py():
+    try:
+        import h5py
+    except ImportError:
+        raise ImportError("The h5py package is needed to read and write HDF5 files. Please install it with pip install h5py")
+    return h5py
+
+
+@contextmanager
+def open_group(filename: str, path: str, mode: str = "r"):
+    """
+    Open the group path of the HDF5 file filename. In write mode the group is
+    replaced if it exists already.
+
+    Parameters
+    ----------
+    filename    : string, required
+                  name of the HDF5 file.
+    path        : string, required
+                  name of the group inside the file.
+    mode        : string, optional
+                  "r" to read (default), "a" to write.
+    """
+    with _h5py().File(filename, mode) as f:
+        if mode == "r":
+            if path not in f:
+                raise KeyError(f"Could not find {path} in {filename}.")
+            yield f[path]
+        else:
+            if path in f: del f[path]
+            yield f.create_group(path)
+
+
+def write_dataset(group, name: str, data, chunks=True) -> None:
+    """
+    Store data as a gzip compressed, chunked dataset.
+
+    Parameters
+    ----------
+    group       : h5py.Group, required
+                  where to store the dataset.
+    name        : string, required
+                  name of the dataset.
+    data        : np.ndarray, required
+                  the data.
+    chunks      : tuple or bool, optional
+                  chunk shape. Default lets h5py choose.
+    """
+    data = np.asarray(data)
+    if data.ndim == 0 or data.size == 0:
+        group.create_dataset(name, data=data)
+        return
+    if isinstance(chunks, tuple):
+        chunks = tuple(max(1, min(c, n)) for c, n in zip(chunks, data.shape))
+    group.create_dataset(name, data=data, chunks=chunks, compression="gzip", shuffle=True)
+
+
+def write_meta(group, **meta) -> None: group.attrs["meta"] = json.dumps(meta)
+
+
+def read_meta(group) -> dict: return json.loads(group.attrs["meta"])
+
+
+def window_slice(emin: np.ndarray, emax: np.ndarray, energy_window: Tuple[float, float]) -> slice:
+    """
+    The range of bands that have at least one energy inside energy_window.
+
+    Parameters
+    ----------
+    emin, emax    : np.ndarray, required
+                    minimum and maximum energy of each band.
+    energy_window : tuple(float, float), required
+                    (lower, upper) energy.
+    """
+    if energy_window is None: return slice(None)
+    inside = np.where((emax >= energy_window[0]) & (emin <= energy_window[1]))[0]
+    if len(inside) == 0: return slice(0, 0)
+    return slice(int(inside[0]), int(inside[-1]) + 1)
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+
+##########################################################################
+#
+# w2kplot: a thin Python wrapper around matplotlib
+#
+# Copyright (C) 2022 Harrison LaBollita
+# Authors: H. LaBollita
+#
+# w2kplot is free software licensed under the terms of the MIT license.
+#
+##########################################################################
+
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import List, Dict
+
+# the active Profile, None when profiling is disabled
+_active = None
+_disabled = nullcontext()
+
+
+class _Stage(object):
+    """a timed stage of the active profile, e.g., parse:qtl"""
+
+    def __init__(self, profile, name: str) -> None:
+        self.profile = profile
+        self.name = name
+        self.bytes = 0
+        self.peak = 0
+        self.thread = threading.get_ident()
+        # the peak of tracemalloc covers the whole process, it is only recorded for
+        # stages which never overlapped a stage of another thread
+        self.concurrent = False
+
+    def __enter__(self):
+        stack = self.profile._stack()
+        self.profile._open(self)
+        if self.profile.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if stack: stack[-1].peak = max(stack[-1].peak, peak)
+            if hasattr(tracemalloc, "reset_peak"): tracemalloc.reset_peak()
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        stack = self.profile._stack()
+        stack.pop()
+        self.profile._close(self)
+        if self.profile.memory:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+        if stack:
+            stack[-1].bytes += self.bytes
+            stack[-1].peak = max(stack[-1].peak, self.peak)
+        self.profile._record({"name": self.name,
+                              "start": self.start - self.profile.start,
+                              "duration": end - self.start,
+                              "bytes": self.bytes,
+                              "peak_memory": None if self.concurrent else self.peak,
+                              "process": os.getpid(),
+                              "thread": self.thread,
+                              "depth": len(stack)})
+        return False
+
+
+class Profile(object):
+    """the stages recorded by profile: wall time, bytes read and peak memory of the
+       file discovery, every parser, the artist construction and the rendering.
+       The peak memory is the peak of the whole process while the stage ran; it is
+       None for the stages which overlapped a stage of another thread, e.g., the
+       parsers run concurrently by FatBands.
+    """
+
+    def __init__(self, memory: bool = True) -> None:
+        self.memory = memory
+        self.records = []
+        self.start = time.perf_counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._running = []
+
+    def _stack(self) -> List[_Stage]:
+        if not hasattr(self._local, "stack"): self._local.stack = []
+        return self._local.stack
+
+    def _open(self, stage: _Stage) -> None:
+        with self._lock:
+            for other in self._running:
+                if other.thread != stage.thread:
+                    other.concurrent = stage.concurrent = True
+            self._running.append(stage)
+
+    def _close(self, stage: _Stage) -> None:
+        with self._lock:
+            self._running.remove(stage)
+
+    def _record(self, record: Dict) -> None:
+        with self._lock:
+            self.records.append(record)
+
+    def merge(self, records: List[Dict], start: float) -> None:
+        """
+        Add the records of a profile run in another process, e.g., a worker of w2kplot.batch.
+
+        Parameters
+        ----------
+        records    : list[dict], required
+                     the records of the other profile.
+        start      : float, required
+                     time.perf_counter() at the start of the other profile.
+        """
+        with self._lock:
+            self.records.extend(dict(r, start=r["start"] + start - self.start) for r in records)
+
+    def summary(self) -> str:
+        """
+        a table with the total time, bytes read and peak memory of each stage.
+        """
+        totals = {}
+        for r in self.records:
+            t = totals.setdefault(r["name"], {"calls": 0, "duration": 0.0, "bytes": 0, "peak_memory": None})
+            t["calls"] += 1
+            t["duration"] += r["duration"]
+            t["bytes"] += r["bytes"]
+            if r["peak_memory"] is not None:
+                t["peak_memory"] = max(t["peak_memory"] or 0, r["peak_memory"])
+        lines = [f"{'stage':<28}{'calls':>6}{'time (s)':>12}{'read (MB)':>12}{'peak (MB)':>12}"]
+        for name, t in sorted(totals.items(), key=lambda item: -item[1]["duration"]):
+            # stages overlapping other threads have no peak of their own
+            peak = "-" if t["peak_memory"] is None else f"{t['peak_memory'] / 2**20:.2f}"
+            lines.append(f"{name:<28}{t['calls']:>6}{t['duration']:>12.4f}"
+                         f"{t['bytes'] / 2**20:>12.2f}{peak:>12}")
+        return "\n".join(lines)
+
+    def to_json(self, filename: str) -> None:
+        """
+        Write the recorded stages to filename as JSON.
+        """
+        with open(filename, "w") as f:
+            json.dump({"memory": self.memory, "stages": self.records}, f, indent=1)
+
+    def to_chrome_trace(self, filename: str) -> None:
+        """
+        Write the recorded stages to filename in the Chrome trace event format,
+        which can be opened in chrome://tracing or https://ui.perfetto.dev.
+        """
+        events = [{"name": r["name"],
+                   "cat": r["name"].split(":")[0],
+                   "ph": "X",
+                   "ts": r["start"] * 1e6,
+                   "dur": r["duration"] * 1e6,
+                   "pid": r["process"],
+                   "tid": r["thread"],
+                   "args": {"bytes": r["bytes"], "peak_memory": r["peak_memory"]}}
+                  for r in self.records]
+        with open(filename, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def stage(name: str):
+    """
+    Context manager timing the stage name of the active profile. When profiling is
+    disabled this returns a shared no-op context manager.
+
+    Parameters
+    ----------
+    name       : string, required
+                 name of the stage, e.g., discovery, parse:qtl, artists:band_plot or render.
+    """
+    return _disabled if _active is None else _Stage(_active, name)
+
+
+def add_bytes(filename: str) -> None:
+    """
+    Count the size of filename as read by the current stage of the active profile.
+    """
+    if _active is None or not isinstance(filename, str): return
+    stack = _active._stack()
+    if stack:
+        try:
+            stack[-1].bytes += os.path.getsize(filename)
+        except OSError:
+            pass
+
+
+def timed(name: str, filename=None):
+    """
+    Decorator running the function inside stage(name). When profiling is disabled
+    the function is called directly.
+
+    Parameters
+    ----------
+    name       : string, required
+                 name of the stage.
+    filename   : callable, optional
+                 called with the arguments of the function, returns the file it reads.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active is None: return func(*args, **kwargs)
+            with _Stage(_active, name):
+                if filename is not None: add_bytes(filename(*args, **kwargs))
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def profile(memory: bool = True):
+    """
+    Profile the w2kplot stages run inside the with block.
+
+        with w2kplot.profile() as p:
+            ax.fatband_plot(FatBands(...))
+            plt.savefig('plot.png')
+        print(p.summary())
+        p.to_chrome_trace('trace.json')
+
+    Parameters
+    ----------
+    memory     : bool, optional
+                 also record the peak memory of each stage with tracemalloc, which
+                 slows down the profiled code. The peak covers the whole process and
+                 is None for stages overlapping stages of other threads. Default is True.
+    """
+    global _active
+    from matplotlib.figure import Figure
+
+    previous, _active = _active, Profile(memory)
+    started_tracing = memory and not tracemalloc.is_tracing()
+    if started_tracing: tracemalloc.start()
+
+    # time the rendering of every figure saved while profiling
+    savefig = Figure.savefig
+    def timed_savefig(self, *args, **kwargs):
+        with stage("render"):
+            return savefig(self, *args, **kwargs)
+    Figure.savefig = timed_savefig
+    try:
+        yield _active
+    finally:
+        Figure.savefig = savefig
+        if started_tracing: tracemalloc.stop()
+        _active = previous
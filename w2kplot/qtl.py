@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+##########################################################################
+#
+# w2kplot: a thin Python wrapper around matplotlib
+#
+# Copyright (C) 2022 Harrison LaBollita
+# Authors: H. LaBollita
+#
+# w2kplot is free software licensed under the terms of the MIT license.
+#
+##########################################################################
+
+import numpy as np
+from typing import List
+
+from .utils import open_file, find_files, compact_array
+from .profiling import stage, add_bytes
+from .hdf5 import open_group, write_dataset, write_meta, read_meta, window_slice
+
+
+class Qtl(object):
+    """this is a wien2k qtl class that contains the orbital character
+       of every band at every kpoint, parsed once from case.qtl.
+    """
+    __slots__ = ("filename", "orbitals", "nbands", "nkpoints", "energy", "_character")
+
+    def __init__(self, filename: str = None, dtype=None) -> None:
+        """
+        Initialize the Qtl class. The entire case.qtl file is read in a single
+        pass and stored per atom, so that any number of (atom, orbital) projections
+        can be extracted without re-reading the file.
+
+        Parameters
+        ----------
+        filename : string, optional
+                   Filename of case.qtl. If not given find_files will search current directory
+                   for file with extension .qtl.
+        dtype    : numpy dtype, optional
+                   dtype of the orbital character, e.g., np.float32 or np.float16. The energies
+                   are kept in at least single precision. Default is float64.
+        """
+        if filename is None:
+            try:
+                filename = find_files("*.qtl")[0]
+            except BaseException:
+                raise FileNotFoundError(
+                    "Could not find a case.qtl file in this directory. Please provide a case.qtl file")
+        self.filename = filename
+        with stage("parse:qtl"):
+            add_bytes(self.filename)
+            try:
+                f = open_file(self.filename)
+                contents = f.readlines()
+                f.close()
+            except BaseException:
+                raise FileNotFoundError(f"Could not find {self.filename}.")
+            try:
+                self._load(contents, dtype)
+            except BaseException:
+                raise Exception(
+                    "An error occured when trying to parse the {} file".format(self.filename))
+
+    def _load(self, contents: List[str], dtype=None) -> None:
+        """
+        Internal function to parse the contents of the case.qtl file.
+
+        Parameters
+        ----------
+        contents : list[string], required
+                   lines of the case.qtl file.
+        dtype    : numpy dtype, optional
+                   dtype of the orbital character.
+        """
+        start = [il for il, line in enumerate(contents) if "BAND" in line][0]
+
+        # orbital names of each atom from the header, i.e., tot,0,1,2,3,...
+        self.orbitals = [line.split()[-1].split(",") for line in contents[:start] if "JATOM" in line]
+
+        rows, nbands = self._group(contents[start:])
+        self._set_rows(rows, nbands, dtype)
+
+    def _set_rows(self, rows, nbands: int, dtype=None) -> None:
+        """
+        Internal function to store the rows grouped by _group as the energy and the
+        orbital character of nbands bands.
+        """
+        self.nbands = nbands
+        self._character = {atom: compact_array(data.reshape(nbands, -1, data.shape[1]), dtype)
+                           for atom, data in rows.items()}
+        self.nkpoints = self._character[1].shape[1]
+
+        # energy (Ry) of each band at each kpoint, a view of the first column unless converted
+        if dtype is None:
+            self.energy = self._character[1][:, :, 0]
+        else:
+            self.energy = compact_array(rows[1][:, 0].reshape(nbands, -1), dtype, energy=True)
+
+    @staticmethod
+    def _from_blocks(blocks: List[List[str]]):
+        """
+        Internal function to build a Qtl from the lines of complete BAND blocks without
+        their headers, e.g., the blocks appended to a case.qtl that is still being written.
+        """
+        qtl = Qtl.__new__(Qtl)
+        qtl.filename, qtl.orbitals = None, None
+        rows, _ = Qtl._group([line for block in blocks for line in block])
+        qtl._set_rows(rows, len(blocks))
+        return qtl
+
+    @staticmethod
+    def _group(lines: List[str]):
+        """
+        Internal function to group the lines of BAND blocks by atom.
+
+        Parameters
+        ----------
+        lines    : list[string], required
+                   lines of one or more BAND blocks of the case.qtl file.
+
+        Returns
+        -------
+        rows     : dict
+                   atom -> array with one row per kpoint and band: energy, atom, tot, orbitals...
+        nbands   : int
+                   number of BAND headers in lines.
+        """
+        # the atom index is the second column
+        grouped = {}
+        nbands = 0
+        for line in lines:
+            if "BAND" in line:
+                nbands += 1
+                continue
+            cols = line.split(None, 2)
+            if len(cols) < 3: continue
+            grouped.setdefault(int(cols[1]), []).append(line)
+
+        rows = {atom: np.array(" ".join(group).split(), dtype=float).reshape(len(group), -1)
+                for atom, group in grouped.items()}
+        return rows, nbands
+
+    def character(self, atom: int, orbital: int) -> np.ndarray:
+        """
+        Orbital character of every band at every kpoint.
+
+        Parameters
+        ----------
+        atom        : int, required
+                      Index of atom from case.struct (1-based).
+        orbital     : int, required
+                      Index of the orbital in the header of the case.qtl for this atom (1-based).
+
+        Returns
+        -------
+        character   : np.ndarray
+                      array of shape (nbands, nkpoints).
+        """
+        # columns are: energy, atom, tot, orbitals...
+        return self._character[atom][:, :, int(orbital) + 1]
+
+    def compact(self, atoms: List[int] = None, dtype=None):
+        """
+        A Qtl holding only the character of atoms, stored as dtype. Without dtype the
+        character is shared with this Qtl instead of copied.
+
+        Parameters
+        ----------
+        atoms       : list[int], optional
+                      atoms to keep. Default keeps all atoms.
+        dtype       : numpy dtype, optional
+                      dtype of the orbital character, the energies are kept in at least single precision.
+        """
+        qtl = Qtl.__new__(Qtl)
+        qtl.filename, qtl.orbitals = self.filename, self.orbitals
+        qtl.nbands, qtl.nkpoints = self.nbands, self.nkpoints
+        atoms = self._character.keys() if atoms is None else set(atoms)
+        if dtype is None:
+            qtl._character = {atom: self._character[atom] for atom in atoms}
+            # energies viewing the character of a dropped atom would keep all of it in memory
+            shared = any(np.may_share_memory(self.energy, data) for data in qtl._character.values())
+            qtl.energy = self.energy if shared else self.energy.copy()
+        else:
+            qtl.energy = compact_array(self.energy, dtype, energy=True)
+            qtl._character = {atom: compact_array(self._character[atom], dtype) for atom in atoms}
+        return qtl
+
+    @property
+    def nbytes(self) -> int:
+        """
+        memory used by the energies and the orbital character, in bytes.
+        """
+        # energies viewing the character of the first atom take no extra memory
+        shared = any(np.may_share_memory(self.energy, data) for data in self._character.values())
+        energy = 0 if shared else self.energy.nbytes
+        return energy + sum(data.nbytes for data in self._character.values())
+
+    def to_hdf5(self, filename: str, path: str = "qtl") -> None:
+        """
+        Store the orbital character in the group path of the HDF5 file filename.
+
+        Parameters
+        ----------
+        filename   : string, required
+                     Filename of the HDF5 file. It is created if it does not exist.
+        path       : string, optional
+                     Name of the group inside the file.
+        """
+        with open_group(filename, path, "a") as group:
+            self._write_hdf5(group)
+
+    def _write_hdf5(self, group) -> None:
+        write_dataset(group, "energy", self.energy, chunks=(16, self.nkpoints))
+        # one chunk per column, such that a single orbital can be read on its own
+        for atom, data in self._character.items():
+            write_dataset(group, f"atom{atom}", data, chunks=(16, self.nkpoints, 1))
+        write_meta(group, filename=self.filename, orbitals=self.orbitals)
+
+    @staticmethod
+    def from_hdf5(filename: str, path: str = "qtl", atoms: List[int] = None, energy_window=None):
+        """
+        Load the orbital character stored with to_hdf5.
+
+        Parameters
+        ----------
+        filename      : string, required
+                        Filename of the HDF5 file.
+        path          : string, optional
+                        Name of the group inside the file.
+        atoms         : list[int], optional
+                        read only the character of these atoms. Default is all atoms.
+        energy_window : tuple(float, float), optional
+                        (lower, upper) energy in Ry. Only the bands with at least one energy
+                        inside the window are read from the file.
+        """
+        with open_group(filename, path) as group:
+            return Qtl._read_hdf5(group, atoms, energy_window)
+
+    @staticmethod
+    def _read_hdf5(group, atoms: List[int] = None, energy_window=None):
+        meta = read_meta(group)
+        energy = group["energy"][()]
+        rows = window_slice(energy.min(axis=1), energy.max(axis=1), energy_window)
+        if atoms is None:
+            atoms = [int(name[len("atom"):]) for name in group if name.startswith("atom")]
+
+        qtl = Qtl.__new__(Qtl)
+        qtl.filename = meta["filename"]
+        qtl.orbitals = meta["orbitals"]
+        qtl.energy = energy[rows]
+        qtl.nbands, qtl.nkpoints = qtl.energy.shape
+        qtl._character = {int(atom): group[f"atom{atom}"][rows] for atom in set(atoms)}
+        return qtl
+
+    def __len__(self): return self.nbands
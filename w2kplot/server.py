@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+
+##########################################################################
+#
+# w2kplot: a thin Python wrapper around matplotlib
+#
+# Copyright (C) 2022 Harrison LaBollita
+# Authors: H. LaBollita
+#
+# w2kplot is free software licensed under the terms of the MIT license.
+#
+##########################################################################
+
+import io
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from urllib.parse import urlparse, parse_qs
+from typing import Dict, Tuple
+
+import matplotlib
+
+from .batch import default_spec, draw_case
+from .export import savefig
+
+content_types = {"png": "image/png",
+                 "svg": "image/svg+xml",
+                 "pdf": "application/pdf"}
+
+
+class CaseCache(object):
+    """a size-bounded, least recently used cache of parsed cases. Every Case
+       keeps its parsed files, so a warm request only stats the files of the case.
+    """
+
+    def __init__(self, max_cases: int = 16) -> None:
+        """
+        Parameters
+        ----------
+        max_cases  : int, optional
+                     maximum number of cases kept in memory.
+        """
+        self.max_cases = max_cases
+        self.hits, self.misses = 0, 0
+        self._cases = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading = {}          # directory -> lock held while its Case is created
+
+    def get(self, directory: str):
+        """
+        The Case of directory, parsed lazily and cached. A case is reloaded when
+        a file was added, removed or rewritten, e.g., a new case.scf after an SCF run.
+        """
+        from .case import Case
+
+        key = os.path.abspath(directory)
+        with self._lock:
+            loading = self._loading.setdefault(key, threading.Lock())
+        # concurrent requests for the same cold case wait for a single Case
+        with loading:
+            signature = self._signature(key)
+            with self._lock:
+                if key in self._cases and self._cases[key][1] == signature:
+                    self._cases.move_to_end(key)
+                    self.hits += 1
+                    return self._cases[key][0]
+                self.misses += 1
+            case = Case(directory=key)
+            with self._lock:
+                self._cases[key] = (case, signature)
+                self._cases.move_to_end(key)
+                while len(self._cases) > self.max_cases:
+                    evicted, _ = self._cases.popitem(last=False)
+                    self._loading.pop(evicted, None)
+        return case
+
+    @staticmethod
+    def _signature(directory: str) -> Tuple:
+        """
+        Internal function returning the name, modification time and size of every file in directory.
+        """
+        with os.scandir(directory) as entries:
+            return tuple(sorted((entry.name, entry.stat().st_mtime_ns, entry.stat().st_size)
+                                for entry in entries if entry.is_file()))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"cases": list(self._cases), "max_cases": self.max_cases,
+                    "hits": self.hits, "misses": self.misses}
+
+
+def parse_query(query: str) -> Tuple[str, Dict]:
+    """
+    Convert the query of a /plot request into the case directory and the plot specification.
+    Lists are separated by commas, and the orbitals of different atoms by semicolons,
+    e.g., /plot?case=cs35&plot=fatbands&atoms=2,4&orbitals=7;3&format=svg
+
+    Returns
+    -------
+    directory  : string
+                 the case directory.
+    spec       : dict
+                 plot specification, see w2kplot.batch.default_spec.
+    """
+    params = {key: values[-1] for key, values in parse_qs(query).items()}
+    if "case" not in params:
+        raise ValueError("missing the case parameter")
+    directory = params.pop("case")
+
+    spec = {"dpi": 100}
+    for key, value in params.items():
+        if key not in default_spec:
+            raise ValueError(f"unknown parameter {key}")
+        if key == "atoms":
+            spec[key] = [int(a) for a in value.split(",")]
+        elif key == "orbitals":
+            spec[key] = [[int(o) for o in orbs.split(",")] for orbs in value.split(";")]
+        elif key == "colors":
+            spec[key] = [colors.split(",") for colors in value.split(";")]
+        elif key == "figsize":
+            spec[key] = tuple(float(x) for x in value.split(","))
+        elif key in ["ymin", "ymax", "lw"]:
+            spec[key] = float(value)
+        elif key in ["weight", "dpi"]:
+            spec[key] = int(value)
+        else:
+            spec[key] = value
+    if spec.get("format", "png") not in content_types:
+        raise ValueError(f"unknown format {spec['format']}, must be one of {list(content_types)}")
+    return directory, spec
+
+
+class PlotRequestHandler(BaseHTTPRequestHandler):
+    """handles GET /plot?case=...&plot=... and GET /stats"""
+
+    def address_string(self):
+        # unix sockets have no client address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/stats":
+            return self._reply(200, "application/json", json.dumps(self.server.cache.stats()).encode())
+        if url.path != "/plot":
+            return self._reply(404, "text/plain", b"unknown path, use /plot or /stats")
+
+        start = time.perf_counter()
+        try:
+            directory, spec = parse_query(url.query)
+            case = self.server.cache.get(directory)
+        except (ValueError, OSError) as e:
+            # e.g., a missing case, a file instead of a directory or a directory without permission
+            return self._reply(400, "text/plain", str(e).encode())
+
+        fmt = spec.get("format", "png")
+        buffer = io.BytesIO()
+        try:
+            with self.server.workers:
+                fig = draw_case(case, spec)
+                savefig(fig, buffer, format=fmt, dpi=spec["dpi"])
+        except Exception as e:
+            return self._reply(500, "text/plain", f"{type(e).__name__}: {e}".encode())
+        self._reply(200, content_types[fmt], buffer.getvalue(),
+                    {"X-Render-Time": f"{time.perf_counter() - start:.4f}"})
+
+    def _reply(self, code: int, content_type: str, body: bytes, headers: Dict = None) -> None:
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items(): self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(host: str = "127.0.0.1",
+                port: int = 8050,
+                socket: str = None,
+                max_cases: int = 16,
+                workers: int = 4):
+    """
+    Create the plot server. Call serve_forever() on the result to start it.
+
+    Parameters
+    ----------
+    host       : string, optional
+                 address to listen on.
+    port       : int, optional
+                 port to listen on. 0 picks a free port.
+    socket     : string, optional
+                 path of a unix socket to listen on instead of host and port.
+    max_cases  : int, optional
+                 number of parsed cases kept in memory.
+    workers    : int, optional
+                 number of figures rendered at the same time.
+    """
+    matplotlib.use("Agg")
+    if socket is not None:
+        if os.path.exists(socket): os.remove(socket)
+        server = _ThreadingUnixHTTPServer(socket, PlotRequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), PlotRequestHandler)
+        server.daemon_threads = True
+    server.cache = CaseCache(max_cases)
+    server.workers = threading.BoundedSemaphore(workers)
+    return server
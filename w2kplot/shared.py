@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+##########################################################################
+#
+# w2kplot: a thin Python wrapper around matplotlib
+#
+# Copyright (C) 2022 Harrison LaBollita
+# Authors: H. LaBollita
+#
+# w2kplot is free software licensed under the terms of the MIT license.
+#
+##########################################################################
+
+"""
+hand the parsed data objects to other processes without copying them. The arrays of
+an object are published in a single multiprocessing.shared_memory block, and the
+small, picklable SharedHandle is sent to the workers, which attach the block and
+rebuild the object on top of it with zero copies.
+
+    with fat_bands.to_shared() as shared:
+        with ProcessPoolExecutor(initializer=init, initargs=(shared.handle,)) as pool:
+            ...
+
+    def init(handle):
+        global fat_bands
+        fat_bands = handle.attach()
+"""
+
+import sys
+import numpy as np
+from multiprocessing import shared_memory
+from typing import Dict
+
+# byte alignment of the arrays inside a block
+_alignment = 64
+
+# blocks attached by this process, kept open while their arrays are in use
+_attached = {}
+
+
+class Shareable(object):
+    """mixin of the data objects which can be published in shared memory. A subclass
+       implements _shared_arrays, returning its arrays and picklable metadata, and the
+       staticmethod _from_shared, rebuilding the object from both.
+    """
+
+    __slots__ = ()
+
+    def to_shared(self):
+        """
+        Publish the arrays of this object in a shared memory block, see w2kplot.shared.
+        Other processes attach them without copies with handle.attach() of the returned SharedData.
+        """
+        return SharedData(self)
+
+
+class SharedHandle(object):
+    """picklable description of a published object: its class, metadata and the
+       position of each array inside the shared memory block.
+    """
+
+    def __init__(self, cls, name: str, layout: Dict, meta: Dict) -> None:
+        self.cls = cls
+        self.name = name
+        self.layout = layout        # array name -> (offset, shape, dtype)
+        self.meta = meta
+
+    def arrays(self, buffer) -> Dict[str, np.ndarray]:
+        """
+        Read-only views of the arrays in buffer.
+        """
+        arrays = {}
+        for key, (offset, shape, dtype) in self.layout.items():
+            array = np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+            array.flags.writeable = False
+            arrays[key] = array
+        return arrays
+
+    def attach(self):
+        """
+        Attach the shared memory block and rebuild the object on top of it.
+        """
+        if self.name not in _attached:
+            if sys.version_info >= (3, 13):
+                _attached[self.name] = shared_memory.SharedMemory(name=self.name, track=False)
+            else:
+                _attached[self.name] = shared_memory.SharedMemory(name=self.name)
+        return self.cls._from_shared(self.arrays(_attached[self.name].buf), self.meta)
+
+    def detach(self) -> None:
+        """
+        Close the block in this process, once the attached objects are no longer referenced.
+        """
+        shm = _attached.get(self.name)
+        if shm is None: return
+        try:
+            shm.close()
+        except BufferError:
+            # arrays of an attached object are still referenced, the mapping stays until exit
+            return
+        del _attached[self.name]
+
+
+class SharedData(object):
+    """the shared memory block of a published object, owned by the publishing process.
+       It is removed by close, or at the end of a with block.
+    """
+
+    def __init__(self, obj) -> None:
+        """
+        Parameters
+        ----------
+        obj        : Bands, FatBands, DensityOfStates or ChargeDensity, required
+                     the object to publish.
+        """
+        arrays, meta = obj._shared_arrays()
+        layout, size = {}, 0
+        for key, array in arrays.items():
+            array = np.asarray(array)
+            layout[key] = (size, array.shape, array.dtype.str)
+            size += -(-array.nbytes // _alignment) * _alignment
+
+        self._shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.handle = SharedHandle(type(obj), self._shm.name, layout, meta)
+        for key, array in arrays.items():
+            offset, shape, dtype = layout[key]
+            np.ndarray(shape, dtype=dtype, buffer=self._shm.buf, offset=offset)[...] = array
+
+    @property
+    def nbytes(self) -> int: return self._shm.size
+
+    def close(self) -> None:
+        """
+        Remove the block. Processes that attached it keep their mapping until they detach.
+        """
+        if self._shm is None: return
+        self.handle.detach()
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+
+    def __enter__(self): return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
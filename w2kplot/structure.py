@@ -11,10 +11,12 @@
 #
 ##########################################################################
 
-import glob
 import types
 from typing import Union, List, Dict
 
+from .utils import open_file, find_files
+from .profiling import timed
+
 
 class Structure(object):
     """this is a wien2k structure class that contains the information
@@ -30,7 +32,7 @@ class Structure(object):
         Parameters
         ----------
         filename : string, optional
-                   Filename of case.struct. If not given glob.glob will search current directory
+                   Filename of case.struct. If not given find_files will search current directory
                    for file with extension .struct.
         """
         if filename is None:
@@ -42,6 +44,7 @@ class Structure(object):
         else:
             self._load(filename=filename)
 
+    @timed("parse:struct", filename=lambda self, filename=None: filename)
     def _load(self, filename: str = None) -> None:
         """
         Function to parse struct file and store the data into the Structure class
@@ -49,15 +52,15 @@ class Structure(object):
         Parameters
         ----------
         filename : string, optional
-                   Filename of case.struct. If not given glob.glob will search current directory
+                   Filename of case.struct. If not given find_files will search current directory
                    for file with extension .struct.
         """
         if filename is None:
-            struct_file = open(glob.glob("*.struct")[0])
+            struct_file = open_file(find_files("*.struct")[0])
             contents = struct_file.readlines()
             struct_file.close()
         else:
-            f = open(filename)
+            f = open_file(filename)
             contents = f.readlines()
             f.close()
 
@@ -85,6 +88,22 @@ class Structure(object):
         # load the symmetries in the structure here as well.
         # store them in self.symmetries
 
+    def to_dict(self) -> dict:
+        """
+        the structure as a dictionary of plain python types, e.g., to store it in a file.
+        """
+        return {"nat": self.nat, "spg": self.spg, "atoms": [self.atoms[a] for a in range(self.nat)]}
+
+    @staticmethod
+    def from_dict(data: dict):
+        """
+        Build a Structure from the dictionary returned by to_dict.
+        """
+        structure = Structure.__new__(Structure)
+        structure.nat, structure.spg = data["nat"], data["spg"]
+        structure.atoms = {a: list(atom) for a, atom in enumerate(data["atoms"])}
+        return structure
+
     # dunder functions
     def __getitem__(self, key): return self.atoms[key]
     def __len__(self): return len(self.atoms)
@@ -1,8 +1,174 @@
 from matplotlib.lines import Line2D
+from concurrent.futures import ThreadPoolExecutor
+import bz2
+import glob
+import gzip
+import io
+import lzma
+import os
+import queue
+import threading
 import numpy as np
 
+from .profiling import timed
+
 make_label = lambda **kwargs: Line2D([0], [0], **kwargs)
 
+def load_concurrently(loaders, max_workers=None):
+    """
+    Run the loaders concurrently on a thread pool, such that the latency of reading
+    each file is overlapped with the parsing of the others.
+
+    Parameters
+    ----------
+    loaders     : dict, required
+                  name -> callable without arguments that reads and parses a file.
+    max_workers : int, optional
+                  number of threads. Default is one per loader.
+
+    Returns
+    -------
+    results     : dict
+                  name -> result of the loader. If loaders fail, the exception of the first
+                  failing loader (in the order given) is raised, as if they ran one after another.
+    """
+    if not loaders: return {}
+    with ThreadPoolExecutor(max_workers=max_workers or len(loaders)) as pool:
+        futures = {name: pool.submit(loader) for name, loader in loaders.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+def _zstd_open(filename):
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(f"The zstandard package is needed to read {filename}. Please install it with pip install zstandard")
+    return zstandard.ZstdDecompressor().stream_reader(open(filename, "rb"), closefd=True)
+
+
+# supported compressed file extensions -> function opening the file as a binary stream
+compressions = {".gz": gzip.open,
+                ".bz2": bz2.open,
+                ".xz": lzma.open,
+                ".zst": _zstd_open}
+
+
+class _ReadAhead(io.RawIOBase):
+    """decompresses a binary stream in a background thread, such that the
+       decompression overlaps with the parsing of the data already read.
+    """
+
+    def __init__(self, stream, chunk_size=1 << 20, depth=4):
+        self._stream = stream
+        self._chunks = queue.Queue(maxsize=depth)
+        self._buffer = memoryview(b"")
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._fill, args=(chunk_size,), daemon=True)
+        self._thread.start()
+
+    def _fill(self, chunk_size):
+        try:
+            while not self._stop.is_set():
+                chunk = self._stream.read(chunk_size)
+                self._put(chunk)
+                if not chunk: break
+        except BaseException as e:
+            self._put(e)
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self): return True
+
+    def readinto(self, b):
+        if not self._buffer:
+            chunk = self._chunks.get()
+            if isinstance(chunk, BaseException):
+                self._chunks.put(chunk)   # raise it again on every later read
+                raise chunk
+            if not chunk:
+                self._chunks.put(chunk)   # stay at the end of the stream
+                return 0
+            self._buffer = memoryview(chunk)
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+            self._stream.close()
+        super().close()
+
+
+def open_file(filename: str, mode: str = "r"):
+    """
+    Open filename for reading. Files ending in .gz, .bz2, .xz or .zst are decompressed
+    on the fly in a background thread, without any temporary file.
+
+    Parameters
+    ----------
+    filename    : string, required
+                  file to open.
+    mode        : string, optional
+                  "r" for text (default) or "rb" for binary.
+    """
+    ext = os.path.splitext(filename)[1]
+    if ext not in compressions: return open(filename, mode)
+    stream = io.BufferedReader(_ReadAhead(compressions[ext](filename)))
+    return stream if "b" in mode else io.TextIOWrapper(stream)
+
+
+def strip_compression(filename: str) -> str:
+    """
+    filename without the extension of a supported compression, i.e., case.qtl.gz -> case.qtl
+    """
+    base, ext = os.path.splitext(filename)
+    return base if ext in compressions else filename
+
+
+@timed("discovery")
+def find_files(pattern: str):
+    """
+    glob.glob for pattern and its compressed variants. Uncompressed files come first.
+    """
+    return glob.glob(pattern) + [f for ext in compressions for f in glob.glob(pattern + ext)]
+
+
+def case_file(case: str, extension: str) -> str:
+    """
+    Filename of the file of case with extension, or of its compressed variant, i.e.,
+    case_file("cs35", ".qtl") -> cs35.qtl.xz if only the compressed file exists. The
+    uncompressed filename is returned if neither exists.
+    """
+    found = find_files(case + extension)
+    return found[0] if found else case + extension
+
+def compact_array(data, dtype=None, energy: bool = False) -> np.ndarray:
+    """
+    Store data as a C-contiguous array of dtype. Energies and kpoints are never stored
+    below single precision, because float16 resolves only about 0.03 eV at 50 eV.
+
+    Parameters
+    ----------
+    data       : array_like, required
+    dtype      : numpy dtype, optional
+                 e.g., np.float32 or np.float16. Default keeps the dtype of data.
+    energy     : bool, optional
+                 data are energies or kpoints.
+    """
+    if dtype is None: return np.ascontiguousarray(data)
+    dtype = np.dtype(dtype)
+    if energy: dtype = np.promote_types(dtype, np.float32)
+    return np.ascontiguousarray(data, dtype=dtype)
+
+
 def kpath_gen(segments, N=100):
     segments = [(np.asarray(a), np.asarray(b)) for (a,b) in segments]
     x = np.linspace(0, 1, N)
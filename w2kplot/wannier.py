@@ -1,4 +1,3 @@
-import glob
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib as mpl
@@ -7,14 +6,18 @@ import types
 from typing import Union, List, Dict
 
 from . import w2kplot_base_style, w2kplot_bands_style
+from .utils import open_file, find_files, case_file, compact_array
+from .profiling import timed
+from .hdf5 import open_group, write_dataset, write_meta, read_meta
 
 
 # WannierBands class object
 class WannierBands(object):
     # TODO: would it be possible to get high-symmetry points
     # for just a Wannier band plot?
+    __slots__ = ("bohr_to_ang", "wann_bands", "kpts")
 
-    def __init__(self, wann_bands: str = None, case : str = None) -> None:
+    def __init__(self, wann_bands: str = None, case : str = None, dtype=None) -> None:
         """
         Initialze the WannierBands object.
 
@@ -22,30 +25,65 @@ class WannierBands(object):
         ----------
         wann_bands  : string, optional
                       Filename of Wannier90 *_band.dat file.
+        dtype       : numpy dtype, optional
+                      dtype of the kpoints and bands, e.g., np.float32. float16 is promoted to float32.
+                      Default is float64. The memory used is nbytes.
         """
         self.bohr_to_ang = 0.53
         if case and not wann_bands:
-            self.wann_bands = case+'_band.dat'
+            self.wann_bands = case_file(case, '_band.dat')
         else:
             self.wann_bands = wann_bands
 
         if self.wann_bands is None:
             try:
-                self.wann_bands = glob.glob("*_band.dat")[0]
+                self.wann_bands = find_files("*_band.dat")[0]
             except BaseException:
                 raise FileNotFoundError(
                     "Could not find a case_band.dat file in this directory\n. Please provide a case_band.dat file!")
-        self.kpts, self.wann_bands = self._get_wannier_bands()
+        kpts, wann_bands = self._get_wannier_bands()
+        self.kpts = compact_array(kpts, dtype, energy=True)
+        self.wann_bands = compact_array(wann_bands, dtype, energy=True)
 
+    @property
+    def nbytes(self) -> int:
+        """
+        memory used by the kpoints and bands, in bytes.
+        """
+        return self.kpts.nbytes + self.wann_bands.nbytes
+
+    @timed("parse:wannier", filename=lambda self: self.wann_bands)
     def _get_wannier_bands(self):
         """
         internal function for parsing the Wannier90 band.dat file.
         """
-        data = np.loadtxt(self.wann_bands)
+        with open_file(self.wann_bands) as f:
+            data = np.loadtxt(f)
         kpts = np.unique(data[:, 0]) * self.bohr_to_ang
         wann_bands = data[:, 1].reshape(int(len(data) / len(kpts)), len(kpts))
         return kpts, wann_bands
 
+    def to_hdf5(self, filename: str, path: str = "wannier") -> None:
+        """
+        Store the Wannier bands in the group path of the HDF5 file filename.
+        """
+        with open_group(filename, path, "a") as group:
+            write_dataset(group, "kpts", self.kpts)
+            write_dataset(group, "wann_bands", self.wann_bands, chunks=(16, len(self.kpts)))
+            write_meta(group, bohr_to_ang=self.bohr_to_ang)
+
+    @staticmethod
+    def from_hdf5(filename: str, path: str = "wannier"):
+        """
+        Load Wannier bands stored with to_hdf5.
+        """
+        with open_group(filename, path) as group:
+            wannier = WannierBands.__new__(WannierBands)
+            wannier.bohr_to_ang = read_meta(group)["bohr_to_ang"]
+            wannier.kpts, wannier.wann_bands = group["kpts"][()], group["wann_bands"][()]
+        return wannier
+
+
 # Wannier90 bands plotting
 
 
@@ -57,6 +95,7 @@ def wannier_band_plot(wannier_bands,
                                                        **opt_dict)
 
 
+@timed("artists:wannier_band_plot")
 def __wannier_band_plot(figure, wannier_bands, *opt_list, **opt_dict):
     if isinstance(figure, types.ModuleType):
         figure = figure.gca()
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+
+##########################################################################
+#
+# w2kplot: a thin Python wrapper around matplotlib
+#
+# Copyright (C) 2022 Harrison LaBollita
+# Authors: H. LaBollita
+#
+# w2kplot is free software licensed under the terms of the MIT license.
+#
+##########################################################################
+
+import glob
+import os
+import time
+import types
+import numpy as np
+import matplotlib.pyplot as plt
+from typing import Union, List
+
+from .bands import Bands, FatBands, decorate_band_plot, get_default_colors, qtl_to_eV, scatter_character
+from .structure import Structure
+from .qtl import Qtl
+
+
+class _Tail(object):
+    """follows a file that is still being written and returns only the
+       complete lines appended since the last read.
+    """
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self._offset = 0
+        self._partial = b""
+
+    def read(self):
+        """
+        Returns
+        -------
+        lines   : list[string]
+                  complete lines appended since the last read.
+        reset   : bool
+                  True if the file was truncated, i.e., it is being rewritten from the start.
+        """
+        try:
+            size = os.path.getsize(self.filename)
+        except OSError:
+            return [], False
+        reset = size < self._offset
+        if reset:
+            self._offset, self._partial = 0, b""
+        if size == self._offset:
+            return [], reset
+        with open(self.filename, "rb") as f:
+            f.seek(self._offset)
+            chunk = f.read(size - self._offset)
+        self._offset += len(chunk)
+        lines = (self._partial + chunk).split(b"\n")
+        self._partial = lines.pop()
+        return [line.decode() for line in lines], reset
+
+
+class _Blocks(object):
+    """splits lines into the blocks following each header line, e.g., bandindex
+       in case.spaghetti_ene or BAND in case.qtl.
+    """
+
+    def __init__(self, header: str) -> None:
+        self.header = header
+        self.size = None            # number of lines of a block, known after the first one
+        self.preamble = []          # lines before the first header
+        self._lines = None
+
+    def feed(self, lines: List[str]) -> List[List[str]]:
+        """
+        Returns the blocks completed by lines. A block is complete when the next header
+        is found or when it is as long as the first block.
+        """
+        blocks = []
+        for line in lines:
+            if self.header in line:
+                self._finish(blocks)
+            elif self._lines is None:
+                self.preamble.append(line)
+            elif line.strip():
+                self._lines.append(line)
+                if self.size is not None and len(self._lines) == self.size:
+                    self._finish(blocks)
+        return blocks
+
+    def _finish(self, blocks: List[List[str]]) -> None:
+        if self._lines:
+            blocks.append(self._lines)
+            if self.size is None: self.size = len(self._lines)
+        self._lines = []
+
+
+class BandsWatcher(object):
+    def __init__(self,
+                 figure,
+                 spaghetti: str = None,
+                 klist_band: str = None,
+                 eF_shift: float = 0,
+                 *opt_list,
+                 **opt_dict) -> None:
+        """
+        Incrementally plot a case.spaghetti_ene file while it is being written. Every
+        call of update reads only the newly appended bytes and adds a line for every
+        newly completed band.
+
+        Parameters
+        ----------
+        figure     : matplotlib.axes.Axes or matplotlib.pyplot, required
+                     where to plot the bands.
+        spaghetti  : string, optional
+                     Filename of case.spaghetti/up/dn_ene containing the εk information.
+        klist_band : string, optional
+                     Filename of case.klist_band containing the high symmetry points and labels.
+        eF_shift   : float, optional
+                     Optional parameter to shift the Fermi energy. Units are eV.
+        opt_list, opt_dict : optional
+                     passed to matplotlib plot for every band.
+        """
+        if isinstance(figure, types.ModuleType):
+            figure = figure.gca()
+        self.figure = figure
+        self.eF_shift = eF_shift
+        self.opt_list, self.opt_dict = opt_list, opt_dict
+
+        if spaghetti is None:
+            try:
+                spaghetti = glob.glob("*.spaghetti_ene")[0]
+            except BaseException:
+                raise FileNotFoundError(
+                    "Could not find a case.spaghetti_ene file in this directory.\nPlease provide a case.spaghetti_ene file")
+        if klist_band is None:
+            try:
+                klist_band = glob.glob("*.klist_band")[0]
+            except BaseException:
+                raise FileNotFoundError(
+                    "Could not find a case.klist_band file in this directory.\nPlease provide a case.klist_band file")
+        self.spaghetti, self.klist_band = spaghetti, klist_band
+        self.path = Bands._read_klist_band(klist_band)
+        self._decorated = False
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Remove everything that was plotted and start reading from the beginning.
+        """
+        for artist in getattr(self, "artists", []): artist.remove()
+        self.artists = []
+        self.kpoints = None
+        self._tail = _Tail(self.spaghetti)
+        self._blocks = _Blocks("bandindex")
+
+    def _plot_bands(self, blocks: List[List[str]]) -> None:
+        data = np.array(" ".join(line for block in blocks for line in block).split(), dtype=float)
+        data = data.reshape(len(blocks), len(blocks[0]), -1)
+        if self.kpoints is None:
+            self.kpoints = data[0, :, 3]
+        if not self._decorated:
+            indices, labels = self.path
+            decorate_band_plot(self.figure, Bands.from_data(self.kpoints, data[:, :, 4],
+                                                            [self.kpoints[i] for i in indices], labels))
+            self._decorated = True
+        for Ek in data[:, :, 4]:
+            self.artists.extend(self.figure.plot(self.kpoints, Ek - self.eF_shift, *self.opt_list, **self.opt_dict))
+
+    def update(self) -> int:
+        """
+        Read the new data and plot it.
+
+        Returns
+        -------
+        nnew       : int
+                     number of newly completed bands.
+        """
+        lines, reset = self._tail.read()
+        if reset:
+            self.reset()
+            lines, reset = self._tail.read()
+        blocks = self._blocks.feed(lines)
+        if blocks: self._plot_bands(blocks)
+        return len(blocks)
+
+
+class FatBandsWatcher(BandsWatcher):
+    def __init__(self,
+                 figure,
+                 atoms: List[int],
+                 orbitals: List[List[int]],
+                 colors: List[List[str]] = None,
+                 weight: int = 80,
+                 spaghetti: str = None,
+                 klist_band: str = None,
+                 qtl: str = None,
+                 eF: Union[str, float] = None,
+                 struct: Union[str, Structure] = None,
+                 eF_shift: float = 0,
+                 *opt_list,
+                 **opt_dict) -> None:
+        """
+        Incrementally plot the bands and the orbital character while case.spaghetti_ene and
+        case.qtl are being written. The arguments are the same as for FatBands.
+        """
+        self.atoms = atoms
+        self.orbitals = orbitals
+        self.weight = weight
+        self.colors = get_default_colors(atoms, orbitals) if colors is None else colors
+        assert len(self.atoms) == len(
+            self.orbitals), f"list of atoms does not match list of orbitals: {len(atoms)} != {len(orbitals)}"
+
+        if qtl is None:
+            try:
+                qtl = glob.glob("*.qtl")[0]
+            except BaseException:
+                raise FileNotFoundError(
+                    "Could not find a case.qtl file in this directory. Please provide a case.qtl file")
+        if eF is None:
+            try:
+                eF = glob.glob("*.scf")[0]
+            except BaseException:
+                raise FileNotFoundError("Could not find a case.scf file in this directory.\nThis file is needed to determine the Fermi energy.\
+                                         You can instead simply provide this quantity upon initialization.")
+        self.qtl = qtl
+        self.eF = FatBands._read_fermi_energy(eF) if isinstance(eF, str) else eF
+        self.structure = struct if isinstance(struct, Structure) else Structure(struct)
+        super().__init__(figure, spaghetti, klist_band, eF_shift, *opt_list, **opt_dict)
+
+    def reset(self) -> None:
+        super().reset()
+        self._qtl_tail = _Tail(self.qtl)
+        self._qtl_blocks = _Blocks("BAND")
+        self._pending = []          # qtl blocks waiting for the kpoints
+
+    def _plot_character(self, blocks: List[List[str]]) -> None:
+        qtl = Qtl._from_blocks(blocks)
+        E = qtl_to_eV(qtl.energy, self.eF, self.eF_shift)
+        self.artists.extend(scatter_character(self.figure, self, qtl, self.kpoints, E))
+
+    def update(self) -> int:
+        """
+        Read the new data and plot it.
+
+        Returns
+        -------
+        nnew       : int
+                     number of newly completed bands and qtl bands.
+        """
+        nnew = super().update()
+        lines, reset = self._qtl_tail.read()
+        if reset:
+            self.reset()
+            return nnew
+        blocks = self._qtl_blocks.feed(lines)
+        self._pending.extend(blocks)
+        if self._pending and self.kpoints is not None:
+            self._plot_character(self._pending)
+            self._pending = []
+        return nnew + len(blocks)
+
+
+def watch(*watchers, interval: float = 2.0, timeout: float = None, callback=None) -> None:
+    """
+    Poll the watchers and redraw their figure whenever new data was plotted. Returns when
+    the figure is closed or after timeout seconds.
+
+    Parameters
+    ----------
+    watchers   : BandsWatcher, required
+                 the watchers to update.
+    interval   : float, optional
+                 seconds between two updates.
+    timeout    : float, optional
+                 stop watching after timeout seconds. Default is to watch until the figure is closed.
+    callback   : callable, optional
+                 called without arguments after every redraw, e.g., to save the figure.
+    """
+    fig = watchers[0].figure.figure
+    start = time.time()
+    while plt.fignum_exists(fig.number):
+        if sum(w.update() for w in watchers):
+            fig.canvas.draw_idle()
+            if callback is not None: callback()
+        if timeout is not None and time.time() - start > timeout: break
+        plt.pause(interval)